@@ -0,0 +1,74 @@
+import logging
+import sys
+from dataclasses import dataclass
+from typing import Optional, Callable
+
+# compiled actions cached beyond the configured ones (runtime input, eg io.socket)
+MAX_ACTIONS = 256
+
+
+@dataclass(frozen=True)
+class Action:
+    """ User action (eg 'RUMBA.STAR', 'KEY.LEFTALT+P.P' or 'MACRO.PARTY'),
+        compiled once and cached by name, see ActionTable.get()
+    """
+    name: str
+    module: str  # RUMBA, KEY, MENU, MACRO or name of an addon
+    func: str  # function of the module, key macro for KEY actions
+    steps: tuple = ()  # action names of a macro
+    handler: Optional[Callable] = None  # bound handler of RUMBA actions
+
+
+class ActionTable():
+    """ Compiled actions of the controller: all actions of the menu and macros
+        get compiled on init, runtime input (eg io.socket) on first use.
+        Also keeps the modules referenced in the config, input from the socket device
+        for other modules gets rejected (see isValid), configured input is not checked
+    """
+    def __init__(self, config, handlers):
+        self.log = logging.getLogger('ctrl')
+        self.macros = config['controller']['macros']  # user defined action sequences (MACRO.*)
+        self.handlers = handlers  # dispatch table for RUMBA.* actions
+        self.actions = {}  # action name -> Action
+        for row in config['controller']['menuRows']:
+            for item in row:
+                self.get(item)
+        for name in self.macros:
+            self.get(f'MACRO.{name}')
+
+        self.knownModules = {'RUMBA', 'KEY', 'MENU', 'MACRO', *config['controller']['initAddons']}
+        self.knownModules.update(name.upper() for name in config['controller']['addons'])
+        self.knownModules.update(action.module for action in self.actions.values())
+        self.knownModules.update(step.split('.')[0] for steps in self.macros.values() for step in steps)
+        for device in config['io']['devices']:
+            for cfg in (device.get('input') or '').split('\n'):
+                if '.' in cfg:
+                    self.knownModules.add(cfg.split(',')[0].strip().split('.')[0])
+            if device.get('ctrlAction'):  # io.signal
+                self.knownModules.add(device.get('ctrlAction').strip().split('.')[0])
+
+    def get(self, name):
+        """ Compiled action for name, parsed only once """
+        action = self.actions.get(name)
+        if action is None:
+            module, _, func = name.partition('.')
+            steps = tuple(self.macros.get(func, ())) if module == 'MACRO' else ()
+            if any(step.startswith('MENU.') for step in steps):  # depend on the menu shown, not a module
+                self.log.error('Config error: menu buttons can not be part of macro %s', func)
+                steps = tuple(step for step in steps if not step.startswith('MENU.'))
+            handler = self.handlers.get(func) if module == 'RUMBA' else None
+            action = Action(sys.intern(name), module, func, steps, handler)
+            if len(self.actions) < MAX_ACTIONS:  # runtime input must not grow the cache unbounded
+                self.actions[name] = action
+        return action
+
+    def isValid(self, name, menu):
+        """ Checks runtime input against the configured modules, macros and the menu currently shown """
+        module, _, func = name.partition('.')
+        if module not in self.knownModules or not func:
+            return False
+        if module == 'MENU':
+            return func in ('TOGGLE', 'NOTOGGLE') or (func.isdigit() and 0 < int(func) <= len(menu or ()))
+        if module == 'MACRO':
+            return func in self.macros
+        return True
@@ -1,3 +1,4 @@
+import asyncio
 import logging
 import sys
 import os
@@ -9,6 +10,8 @@ class BaseAddon():
         icons and function calls
     """
     CONFIRM = {}
+    KEY_TIMING = 'safe'  # timing profile for injected keys (see keyinjector.PROFILES)
+    KEYS = {}  # addon functions injecting a key macro, registered with the virtual keyboard on init
 
     def __init__(self, config, controller):
         """ addon-config a reference to the controller
@@ -18,6 +21,8 @@ class BaseAddon():
         self.controller = controller
         self.name = type(self).__name__
         self.log = logging.getLogger(f'{self.name}')
+        # can be overridden with 'keyTiming' in the addon config
+        self.keyTiming = config.get('keyTiming', self.KEY_TIMING) if config else self.KEY_TIMING
         self.log.debug('init addon')
 
     def do(self, func, val=None):
@@ -66,3 +71,13 @@ class BaseAddon():
             Needs override for modal addons
         """
         return ['RUMBA.ENABLE']
+
+    @staticmethod
+    async def waitExit(process, timeout=1.0):
+        """ waits until a killed emulator process exited (at most timeout seconds),
+            so the next mode can start right away instead of after a fixed delay
+        """
+        loop = asyncio.get_event_loop()
+        deadline = loop.time() + timeout
+        while process.poll() is None and loop.time() < deadline:
+            await asyncio.sleep(0.05)
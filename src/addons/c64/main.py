@@ -28,6 +28,7 @@ class C64(BaseAddon):
         'ENABLE': 'start c64?',
         'RESETEMU': 'reset c64?'
     }
+    KEY_TIMING = 'vice'
 
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
@@ -65,7 +66,7 @@ class C64(BaseAddon):
         self.log.debug('stopping c64 emulation')
         if self.vice:
             self.vice.kill()
-            await asyncio.sleep(1)
+            await self.waitExit(self.vice)
         self.running = False
         self.log.info('c64 emulation stopped!')
 
@@ -30,6 +30,10 @@ class Mame(BaseAddon):
         'ENABLE': 'start mame?',
         'RESETEMU': 'reset mame?'
     }
+    KEY_TIMING = 'mame'
+    KEYS = {
+        'COIN': '9'
+    }
 
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
@@ -46,8 +50,8 @@ class Mame(BaseAddon):
             await self.controller.changeMode(self)
         elif func == 'RESETEMU':
             await self.controller.resetMode()
-        elif func == 'COIN':
-            await self.controller.pressKey('9')
+        elif func in self.KEYS:
+            await self.controller.pressKey(self.KEYS[func])
         else:
             self.log.warning(f'Method {func} not defined in MAME!')
 
@@ -68,7 +72,7 @@ class Mame(BaseAddon):
         self.log.debug('stopping Mame emulation')
         if self.mame:
             self.mame.kill()
-            await asyncio.sleep(1)
+            await self.waitExit(self.mame)
         self.running = False
         self.log.info('Mame emulation stopped!')
 
@@ -66,11 +66,10 @@ class Projectm(BaseAddon):
                     await asyncio.sleep(self.startupTime)
                     self.log.info('Visualizer started!')
                     self.running = True
-            # if menu shown 'force' update (by changing to None and back again)
-            curMenu = self.controller.state.menuPage
-            if curMenu is not None:
-                self.controller.updateMenuState()
-                self.controller.updateMenuState(curMenu)
+            # icon depends on running state
+            self.controller.invalidateMenu()
+            if self.controller.state.menuPage is not None:
+                self.controller.updateMenuState(self.controller.state.menuPage)
             self.controller.changeRequestRunning()
 
     @hookimpl
@@ -62,6 +62,7 @@ class Retropie(BaseAddon):
         self.es = subprocess.Popen(self.cmd, shell=True)
         await asyncio.sleep(5)  # approx emulationstation startup time on rpi4 (no feedback on startup available)
         self.running = True
+        self.controller.invalidateMenu()  # icon depends on running state
         self.log.info('emulationstation started!')
 
     async def stop(self):
@@ -69,8 +70,9 @@ class Retropie(BaseAddon):
         self.log.debug('stopping emulationstation')
         if self.es:
             self.es.kill()
-            await asyncio.sleep(1)
+            await self.waitExit(self.es)
         self.running = False
+        self.controller.invalidateMenu()  # icon depends on running state
         self.log.info('emulationstation stopped!')
 
     async def resetEmulator(self):
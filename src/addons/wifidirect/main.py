@@ -3,7 +3,7 @@ import os
 import subprocess
 import pluggy
 from addons.base import BaseAddon
-from . import ravel
+from dbusbinding import ravel
 
 hookimpl = pluggy.HookimplMarker("rumba-remote")
 
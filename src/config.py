@@ -1,5 +1,6 @@
 import configparser
 from collections import OrderedDict
+import json
 import os
 import sys
 import shutil
@@ -94,6 +95,12 @@ def readConfig(configFile=None):
         cfgPath = defaultFile if configFile is None else configFile
         raise ModuleNotFoundError(f'No menuRow defined\nin the [controller]-section of your config file:\n{cfgPath}')
 
+    # user defined macros: MACRO.NAME runs a sequence of actions
+    macros = {}
+    if config.has_section('macros'):
+        for name, steps in config.items('macros'):
+            macros[name.upper()] = [step.strip() for step in steps.replace('\n', ',').split(',') if step.strip()]
+
     return {
         'io': {
             'devices': iodevices
@@ -102,17 +109,39 @@ def readConfig(configFile=None):
             'appDir': appDir,
             'configDir': configDir,
             'menuRows': menuRows,
+            'macros': macros,
             'menuTimeout': config.getint('controller', 'menuTimeout', fallback=10),
+            'frameBudget': config.getint('controller', 'frameBudget', fallback=0) / 1000,
+            'timerSlack': config.getint('controller', 'timerSlack', fallback=50) / 1000,
+            'idleTimeout': config.getint('controller', 'idleTimeout', fallback=60),
+            'sleepTimeout': config.getint('controller', 'sleepTimeout', fallback=600),
+            'idlePollInterval': config.getint('controller', 'idlePollInterval', fallback=30),
+            'sleepPollInterval': config.getint('controller', 'sleepPollInterval', fallback=120),
+            'inputQueueDepth': config.getint('controller', 'inputQueueDepth', fallback=8),
+            'inputMaxAge': config.getfloat('controller', 'inputMaxAge', fallback=5),
+            'slowHookThreshold': config.getint('logging', 'slowHookThreshold', fallback=50) / 1000,
+            'loopLagThreshold': config.getint('logging', 'loopLagThreshold', fallback=0) / 1000,
+            'traceFile': config.get('logging', 'traceFile', fallback=None),
+            'inputRecordFile': config.get('logging', 'inputRecordFile', fallback=None),
             'enableVideo': config.getboolean('controller', 'enableVideo', fallback=None),
             'addons': addons,
             'initAddons': initAddons,
+            'preloadAddons': config.getboolean('controller', 'preloadAddons', fallback=True),
         },
         'jukebox': {
             'url': config.get('jukebox', 'url', fallback='http://127.0.0.1:23232/rest/'),
             'username': config.get('jukebox', 'username', fallback='admin'),
             'password': config.get('jukebox', 'password', fallback='admin'),
+            'tokenAuth': config.getboolean('jukebox', 'tokenAuth', fallback=True),
+            'saltLifetime': config.getint('jukebox', 'saltLifetime', fallback=3600),
             'exclude': [int(id) for id in config.get('jukebox', 'excludeFolders', fallback='').split(',') if len(id)],
+            'playlistWindow': config.getint('jukebox', 'playlistWindow', fallback=0),
+            'optimisticUpdates': config.getboolean('jukebox', 'optimisticUpdates', fallback=True),
             'cacheDir': cacheDir,
+            'stateFile': config.get('jukebox', 'stateFile', fallback=os.path.join(configDir, 'jukebox.state')),
+            'snapshotInterval': config.getint('jukebox', 'snapshotInterval', fallback=60),
+            'historyDir': config.get('jukebox', 'historyDir', fallback=os.path.join(configDir, 'history')),
+            'historyDays': config.getint('jukebox', 'historyDays', fallback=30),
             'logLevel': config.get('logging', 'logLevelServer', fallback=logLevel)
         },
     }
@@ -139,3 +168,25 @@ def _initPlugins(config):
             # add to dict
             addons[addonName.lower()] = config[f'addons.{addonName}']
     return (iodevices, addons)
+
+
+def readState(path):
+    """ read json state file, returns None if missing or unreadable """
+    try:
+        with open(path, 'r', encoding='utf-8') as file:
+            return json.load(file)
+    except (OSError, ValueError):
+        return None
+
+
+def writeState(path, data):
+    """ crash-safe write of a json state file:
+        write to a temp file first and atomically rename it afterwards,
+        so an interrupted write never leaves a truncated file behind
+    """
+    tmpPath = f'{path}.tmp'
+    with open(tmpPath, 'w', encoding='utf-8') as file:
+        json.dump(data, file)
+        file.flush()
+        os.fsync(file.fileno())
+    os.replace(tmpPath, path)
@@ -2,45 +2,25 @@ import asyncio
 import subprocess
 import importlib
 import logging
-from dataclasses import dataclass
-from typing import List, Optional, Any
+import os
+import time
+from collections import namedtuple
 import pluggy
-import evdev
 import server as jukebox
+from actions import ActionTable
+from state import State, POWER
+from config import readState, writeState
+from monitor import HookMonitor, LoopMonitor, tracer
+from keyinjector import KeyInjector
+from timers import TimerService
+from recorder import InputRecorder
+from inputqueue import InputQueue, PRIORITY_CONFIRM, PRIORITY_KEY, PRIORITY_DEFAULT
 
 hookspec = pluggy.HookspecMarker("rumba-remote")
 
-
-@dataclass
-class State:
-    """ All internal state that can be shared with addons (eg display) """
-    jukebox: jukebox.JukeboxState
-    menu: Optional[List[int]] = None  # actions currently shown in menu List[int]
-    menuPage: Optional[int] = None  # currently shown menu page
-    activeModule: Optional[Any] = None  # Optional[Module]
-    requestRunning: bool = False  # synchronizes user interaction with the Jukebox
-    confirmState: Optional[bool] = None  # modal confirmation dialog
-    confirmTarget: Optional[int] = None  # for user input that has to be confirmed with dialog
-    confirmText: str = ''  # text for confirmation dialog
-    alert: str = ''  # text for alert dialog
-
-    @property
-    def bgImage(self):
-        """ Optional path to current background image, None gets default image """
-        if self.activeModule is not None:
-            return self.activeModule.getBackgroundImage()
-        return None  # use default image
-
-    @property
-    def rumbaActive(self):
-        """ Info about toggle between rumba jukebox and modal addons """
-        return self.activeModule.name == 'rumba'
-
-    @property
-    def toggleAction(self):
-        """ Action for toggle button """
-        return 'MENU.TOGGLE' if self.activeModule.name == 'rumba' else 'RUMBA.ENABLE'
-
+# change mask for coalesced ui updates (onUpdate)
+UPDATES = ['REQUEST', 'SERVER', 'MODE', 'TRACK', 'POS', 'PLAY', 'MENU', 'ALERT', 'CONFIRM', 'VIDEO', 'INPUT', 'POWER']
+UPDATE = namedtuple('updateConstants', UPDATES)._make(1 << bit for bit in range(len(UPDATES)))
 
 # lots of additional methods bc all pluggy-hooks are directly defined here..
 # pylint: disable=too-many-public-methods, too-many-instance-attributes
@@ -67,23 +47,79 @@ class InputHandler():
         self.configDir = config['controller']['configDir']  # base directory for config files
 
         self.menuRows = config['controller']['menuRows']
+        self.menuPages = {}  # (page, starred) -> cached tuple of menu items, see invalidateMenu()
+        self.macros = config['controller']['macros']  # user defined action sequences (MACRO.*)
         self.menuTimeout = config['controller']['menuTimeout']
+        self.timers = TimerService(config['controller']['timerSlack'])  # shared by all plugins
         self.menuTimer = None  # schedules call to menu hide()
+        # idle state machine
+        self.idleTimeout = config['controller']['idleTimeout']
+        self.sleepTimeout = config['controller']['sleepTimeout']
+        self.idlePoll = config['controller']['idlePollInterval']
+        self.sleepPoll = config['controller']['sleepPollInterval']
+        self.lastInput = time.monotonic()
+        self.powerSince = (self.lastInput, 0)  # time and timer wakeups at last power state change
+        self.powerStats = {power: [0.0, 0] for power in POWER}  # power state -> [seconds, timer wakeups]
+        self.pollWakeup = None  # future ending the current status poll delay
         self.confirmModal = None  # synchronizes feedback for direct confirmation
+        self.requestIdle = asyncio.Event()  # set while no synchronized request is running
+        self.requestIdle.set()
+        # user input gets queued and handled one after the other
+        self.inputQueue = InputQueue(config['controller']['inputQueueDepth'], config['controller']['inputMaxAge'])
+        self.inputTask = None
+        self.statusTask = None  # polls the jukebox, see initTasks
+        self.recorder = None  # records all input for replays
+        if config['controller']['inputRecordFile']:
+            try:
+                self.recorder = InputRecorder(config['controller']['inputRecordFile'])
+            except OSError as oe:
+                self.log.error('Recording input failed: %s', oe)
         self.videoEnabled = config['controller']['enableVideo']
         self.config = config['controller']  # ref for delayed init of addons
+        self.frameBudget = config['controller']['frameBudget']  # collect state changes for one ui update
+        self.pendingUpdates = 0  # change mask of state changes not yet sent via onUpdate
+        self.updateHandle = None  # scheduled onUpdate
 
         # init connection to Jukebox and internal state
         self.server = jukebox.Connector(config['jukebox'], self.serverCallback)
         self.state = State(self.server.jukebox)
 
         self.modules = {}
+        # addons referenced in the menus get preloaded in the background, most used first
+        self.preloadAddons = config['controller']['preloadAddons']
+        self.preloadTask = None  # started with the first frame after the devices are registered
+        self.devicesReady = False
+        self.usageFile = os.path.join(self.configDir, 'addons.usage')
+        self.addonUsage = readState(self.usageFile) or {}  # addon name -> number of actions called
         self.modules['RUMBA'] = self.modules['KEY'] = self
-        self.keyInjector = self.initKeyboard()
+
+        # dispatch table for RUMBA.* actions
+        self.handlers = {
+            'PREV': lambda val: self.navigate('prevSong'),
+            'PLAYPAUSE': lambda val: self.navigate('startStop'),
+            'NEXT': lambda val: self.navigate('nextSong'),
+            'SKIP': lambda val: self.rumba('skip', offset=val),
+            'STAR': lambda val: self.star(True),
+            'UNSTAR': lambda val: self.star(False),
+            'RANDOM': lambda val: self.insertTracks('insertRandom'),
+            'APPROX': lambda val: self.insertTracks('insertSimilar'),
+            'SUBS': lambda val: self.rumba('toggleSubs'),
+            'LANG': lambda val: self.rumba('toggleLang'),
+            'ENABLE': lambda val: self.changeMode(),
+            'BANANAS': lambda val: self.changeConfirm('RUMBA.OK'),  # noop
+            'VIDEO': self.toggleVideoOut,
+        }
+        self.actionTable = ActionTable(config, self.handlers)  # all configured actions get compiled
+
+        self.keyInjector = self.initKeyboard(config)
         self.state.activeModule = self
         self.name = 'rumba'
+        self.lastTransition = None  # timing of the last mode change (see changeMode)
+        self.serverSuspended = False  # jukebox server stopped for an addon (see stop)
 
         self.pm = pluginManager
+        self.traceFile = config['controller']['traceFile']  # chrome trace event export of all input
+        self.hookMonitor, self.loopMonitor = self.initMonitors(config)  # timing of plugin hooks and the event loop
 
         # load addons configured explicitly for startup init (lazy loading for all others)
         for addon in config['controller']['initAddons']:
@@ -91,10 +127,20 @@ class InputHandler():
 
         self.updateMenuState()  # init menu
 
-        # async init (after loop is running) for tasks
-        asyncio.ensure_future(self.initTasks())
-
-    def initKeyboard(self):
+    def initMonitors(self, config):
+        """ Optional instrumentation: hook timing, input tracing and the event loop watchdog,
+            returns hook and loop monitor (None if disabled)
+        """
+        hookMonitor = loopMonitor = None
+        if config['controller']['slowHookThreshold'] > 0:
+            hookMonitor = HookMonitor(self.pm, config['controller']['slowHookThreshold'])
+        if self.traceFile:
+            tracer.start(self.pm)
+        if config['controller']['loopLagThreshold'] > 0:
+            loopMonitor = LoopMonitor(config['controller']['loopLagThreshold'])
+        return hookMonitor, loopMonitor
+
+    def initKeyboard(self, config):
         """ To map (gpio-)keypress, touch input etc to shortcuts/hotkeys inside
             running applications a virtual keyboard is used. When using X11 this
             is straightforward because every app thats running can receive all
@@ -115,17 +161,29 @@ KERNEL=="uinput", SUBSYSTEM=="misc", OPTIONS+="static_node=uinput", TAG+="uacces
 >>>
             XXX: use proper wayland library, probably via https://gitlab.freedesktop.org/libinput/libei
         """
-        # create virtual uinput keyboard with all available keys
-        allKeys = [
-            key for key in evdev.ecodes.keys
-            if isinstance(evdev.ecodes.keys[key], str) and evdev.ecodes.keys[key].startswith('KEY')
-        ]
-        return evdev.UInput({evdev.ecodes.EV_KEY: allKeys}, name='rumba-remote', version=0x3)
+        # virtual uinput keyboard, gets created in the background (see initTasks)
+        # and only supports the keys referenced in menus and input configs
+        keyInjector = KeyInjector('rumba-remote')
+        keyInjector.register(item[4:] for row in self.menuRows for item in row if item.startswith('KEY.'))
+        keyInjector.register(step[4:] for steps in self.macros.values() for step in steps if step.startswith('KEY.'))
+        for device in config['io']['devices']:
+            for cfg in (device.get('input') or '').split('\n'):
+                action = cfg.split(',')[0].strip()
+                if action.startswith('KEY.'):
+                    keyInjector.register([action[4:]])
+        return keyInjector
 
     async def initTasks(self):
-        """ startup tasks """
+        """ startup tasks, get started before the devices are initialized:
+            nothing waits for the jukebox here, the (blocking) device init is not delayed
+            and the sync and virtual keyboard creation continue once the event loop runs
+        """
+        if self.loopMonitor is not None:
+            self.loopMonitor.start(asyncio.get_event_loop())
         self.server.initSession()  # connection to jukebox via aiohttp
-        self.statusTask = asyncio.ensure_future(self.statusUpdate())  # also performs initial getStatus()
+        self.statusTask = asyncio.ensure_future(self.statusUpdate())  # also performs initial sync
+        self.inputTask = asyncio.ensure_future(self.processInput())  # handles queued user input
+        self.keyInjector.prewarm()  # create virtual keyboard while the devices are initialized
 
     async def statusUpdate(self):
         """ Task: polling Jukebox status """
@@ -133,105 +191,155 @@ KERNEL=="uinput", SUBSYSTEM=="misc", OPTIONS+="static_node=uinput", TAG+="uacces
         resp = False
         try:
             while True:
-                resp = await self.rumba('getStatus', syncronized=False)
-                if not resp:
-                    if connected:  # connection lost
-                        self.changeServerRunning(False)
-                    connected = False
-                elif not connected:
-                    # connection restored
-                    connected = True
-                    self.changeServerRunning(True)
-                    if self.videoEnabled is not None:
-                        self.toggleVideoOut(self.videoEnabled)
-                if self.state.rumbaActive and self.state.jukebox.playing:
-                    await asyncio.sleep(1)
-                else:
-                    await asyncio.sleep(5)
+                try:
+                    resp = await self.rumba('getStatus' if connected else 'sync', syncronized=False)
+                    if not resp:
+                        if connected:  # connection lost
+                            self.changeServerRunning(False)
+                        connected = False
+                    elif not connected:
+                        # connection restored
+                        connected = True
+                        self.changeServerRunning(True)
+                        if not self.state.requestRunning:  # mode changes restore the saved state themselves
+                            await self.rumba('recoverState', syncronized=False)
+                        if self.videoEnabled is not None:
+                            self.toggleVideoOut(self.videoEnabled)
+                    if connected and self.state.rumbaActive:
+                        self.server.snapshotState()
+                    self.updatePower()
+                except Exception as e:  # pylint: disable=broad-except
+                    # catchall - keep polling unless task gets cancelled
+                    self.log.exception('Exception during status update: %s', e)
+                await self.pollDelay()
         except asyncio.CancelledError:
             return
-        except Exception as e:  # pylint: disable=broad-except
-            # catchall - keep running unless task gets cancelled
-            self.log.exception('Exception during status update: %s', e)
+
+    async def pollDelay(self):
+        """ waits until the next status poll, interval depends on playback and power state.
+            Waking up (eg on user input) ends the delay right away, see updatePower()
+        """
+        if self.state.power == POWER.SLEEP:
+            delay, slack = self.sleepPoll, self.sleepPoll / 4
+        elif self.state.power == POWER.IDLE:
+            delay, slack = self.idlePoll, self.idlePoll / 4
+        elif self.state.rumbaActive and self.state.jukebox.playing:
+            delay, slack = 1, None
+        else:
+            delay, slack = 5, 1
+        self.pollWakeup = asyncio.get_event_loop().create_future()
+        handle = self.timers.callLater(delay, self.endPollDelay, slack=slack)
+        try:
+            await self.pollWakeup
+        finally:
+            handle.cancel()
+            self.pollWakeup = None
+
+    def endPollDelay(self):
+        """ next status poll right away """
+        if self.pollWakeup is not None and not self.pollWakeup.done():
+            self.pollWakeup.set_result(None)
+
+    def updatePower(self):
+        """ Idle state machine: active while music plays, an addon, the menu or a request is running,
+            idle/sleep after idleTimeout/sleepTimeout seconds without user input (0 disables)
+        """
+        quiet = time.monotonic() - self.lastInput
+        if (self.state.jukebox.playing or not self.state.rumbaActive or self.state.menuPage is not None
+                or self.state.requestRunning or self.state.confirmTarget is not None):
+            power = POWER.ACTIVE
+        elif 0 < self.sleepTimeout <= quiet:
+            power = POWER.SLEEP
+        elif 0 < self.idleTimeout <= quiet:
+            power = POWER.IDLE
+        else:
+            power = POWER.ACTIVE
+        if power != self.state.power:
+            now, wakeups = time.monotonic(), self.timers.getStats()['wakeups']
+            stats = self.powerStats[self.state.power]
+            stats[0] += now - self.powerSince[0]
+            stats[1] += wakeups - self.powerSince[1]
+            self.log.info('power state %s -> %s after %.0f s (%s timer wakeups)', self.state.power, power,
+                          now - self.powerSince[0], wakeups - self.powerSince[1])
+            self.powerSince = (now, wakeups)
+            self.state.power = power
+            if power == POWER.ACTIVE:
+                self.endPollDelay()  # fresh jukebox status after waking up
+            self.onPowerState(power, self.state)
 
     async def do(self, action, val=None):
         """ Maps RUMBA.* action 'constants' from menu or input devices
-            and calls the requested methods
+            and calls the requested methods (see self.handlers)
         """
-        if action == 'PREV':
-            await self.rumba('prevSong')
-        elif action == 'PLAYPAUSE':
-            await self.rumba('startStop')
-        elif action == 'NEXT':
-            await self.rumba('nextSong')
-        elif action == 'SKIP':
-            await self.rumba('skip', offset=val)
-        elif action == 'STAR':
-            await self.rumba('star', starred=True)
-            self.updateMenuState(self.state.menuPage)  # redraw menu
-        elif action == 'UNSTAR':
-            await self.rumba('star', starred=False)
-            self.updateMenuState(self.state.menuPage)
-        elif action == 'RANDOM':
-            await self.rumba('insertRandom')
-            self.updateMenuState(0)
-        elif action == 'APPROX':
-            await self.rumba('insertSimilar')
-            self.updateMenuState(0)
-        elif action == 'SUBS':
-            await self.rumba('toggleSubs')
-        elif action == 'LANG':
-            await self.rumba('toggleLang')
-        elif action == 'ENABLE':
-            await self.changeMode()
-        elif action == 'BANANAS':  # noop
-            self.changeConfirm('RUMBA.OK')
-        elif action == 'VIDEO':
-            self.toggleVideoOut(val)
+        handler = self.handlers.get(action)
+        if handler is None:
+            self.log.error('Unknown action in key handler: %s', action)
+            return
+        result = handler(val)
+        if asyncio.iscoroutine(result):
+            await result
+
+    async def navigate(self, action):
+        """ play/pause and track navigation with optimistic ui update """
+        self.emitChange(self.server.predict(action))
+        await self.rumba(action)
+
+    async def star(self, starred):
+        """ star/unstar current track """
+        await self.rumba('star', starred=starred)
+        self.updateMenuState(self.state.menuPage)  # redraw menu
+
+    async def insertTracks(self, action):
+        """ add tracks to the playlist """
+        await self.rumba(action)
+        self.updateMenuState(0)
+
+    def getAction(self, name):
+        """ Compiled action for name, parsed only once """
+        return self.actionTable.get(name)
+
+    def isValidAction(self, name):
+        """ Checks runtime input (eg from io.socket) against the configured modules, macros and menu """
+        return self.actionTable.isValid(name, self.state.menu)
+
+    async def runAction(self, action, val=None):
+        """ Runs compiled action: key injection, macro, jukebox or addon function """
+        if action.module == 'KEY':  # inject key(-combo)
+            await self.pressKey(action.func)
+        elif action.module == 'MACRO':
+            if not action.steps:
+                self.log.error('Macro %s not defined in [macros]', action.func)
+            for step in action.steps:
+                await self.runAction(self.getAction(step), val)
+        elif action.handler is not None:
+            result = action.handler(val)
+            if asyncio.iscoroutine(result):
+                await result
         else:
-            self.log.exception('Unknown action in key handler: %s', action)
+            # loads module if not initialized yet
+            await self.getModule(action.module).do(action.func, val)
 
     async def pressKey(self, key):
         """ This is really ugly but hey, at least it is working at all!
             See initKeyboard() why direct evdev-input is a problem with wayland,
-            even more so with py-evdevs async input path. While these settings
-            do work with everything tested so far, hopefully a proper
-            wayland lib can replace all this pretty soon..
+            even more so with py-evdevs async input path.
+            Keys are injected with the timing profile of the active module,
+            see keyinjector for the supported macros (chords/sequences)
         """
         self.changeConfirm()
-
-        # remove abbreviation if present (eg KEY.LEFTCTRL+C.CPY)
-        if len(key.split('.')) > 1:
-            key = key.split('.')[0]
-
-        # press meta key first if requested
-        meta = None
-        if len(key.split('+')) > 1:
-            meta, key = key.split('+')
-            self.log.debug('Injecting with meta key: KEY_%s', meta)
-            meta = getattr(evdev.ecodes, f'KEY_{meta}')
-            self.keyInjector.write(evdev.ecodes.EV_KEY, meta, 1)  # meta key down
-            await asyncio.sleep(0.2)
-
-        self.log.debug('Injecting key: KEY_%s', key)
-        key = getattr(evdev.ecodes, f'KEY_{key}')
-        self.keyInjector.write(evdev.ecodes.EV_KEY, key, 1)  # key down
-        await asyncio.sleep(0.5)
-        self.keyInjector.write(evdev.ecodes.EV_KEY, key, 0)  # key up
-        await asyncio.sleep(0.4)
-
-        if meta is not None:
-            self.keyInjector.write(evdev.ecodes.EV_KEY, meta, 0)  # meta key up
-            await asyncio.sleep(0.2)
-
-        self.keyInjector.syn()
+        try:
+            await self.keyInjector.press(key, getattr(self.state.activeModule, 'keyTiming', 'safe'))
+        except ValueError as ve:
+            self.log.error('Config error: %s', ve)
+        except OSError as oe:
+            self.log.error('Key injection failed: %s', oe)
 
     async def rumba(self, action, syncronized=True, **kwargs):
         """ wraps all calls to the Jukebox and emits events for UI etc """
         changed = None
         if syncronized:  # show loader and block multiple concurrent requests/user interactions with the server
-            if self.state.requestRunning:
-                return
+            while self.state.requestRunning:  # wait for running request instead of dropping this one
+                await self.requestIdle.wait()
             self.changeRequestRunning(True)
         try:
             changed = await self.server.call(action, **kwargs)
@@ -242,7 +350,7 @@ KERNEL=="uinput", SUBSYSTEM=="misc", OPTIONS+="static_node=uinput", TAG+="uacces
         except jukebox.JukeboxError as je:
             self.log.exception('JukeboxError: %s', je)  # just log and keep running
         except jukebox.NotFoundError as snfe:
-            if self.state.rumbaActive:  # only show server not found if jukebox currently active
+            if self.state.rumbaActive and not self.serverSuspended:  # only if jukebox active and not stopped
                 if self.state.jukebox.lastModPLS > 0:
                     self.state.jukebox.reset()
                 self.state.alert = str(snfe)
@@ -253,7 +361,14 @@ KERNEL=="uinput", SUBSYSTEM=="misc", OPTIONS+="static_node=uinput", TAG+="uacces
         finally:
             if syncronized:
                 self.changeRequestRunning()
-        # update ui on state change jukebox
+        self.emitChange(changed)
+        # propagate video changes
+        if action == 'toggleVideoOut':
+            self.onToggleVideo(kwargs.get('enabled'), self.state)
+        return True
+
+    def emitChange(self, changed):
+        """ update ui on state change jukebox """
         if changed is not None:
             if changed == jukebox.CHANGE.POS:
                 # update only if menu not shown / pos is seen onscreen
@@ -267,77 +382,96 @@ KERNEL=="uinput", SUBSYSTEM=="misc", OPTIONS+="static_node=uinput", TAG+="uacces
                 # update menu state because of potential track specific menu items (eg star)
                 self.updateMenuState(self.state.menuPage)
                 self.onTrackChange(self.state.jukebox.curPos, self.state.jukebox.curSong, self.state)
-        # propagate video changes
-        if action == 'toggleVideoOut':
-            self.onToggleVideo(kwargs.get('enabled'), self.state)
-        return True
 
     async def onInput(self, action, val=None):
         """ Gets called by input devices with either action/keypress or menukey.
-            Menukeys get mapped first and the requested action/keypress is called async.
+            Menukeys get mapped first and the requested action/keypress is queued,
+            see processInput(). Menu toggles and answers for confirmation dialogs
+            are handled right away.
             Actions can be part of the main/rumba controller (self.do()) or from a
             dynamically loaded module/addon
         """
         self.log.debug('onInput: %s(%s)', action, val)
-        try:
-            # modal confirmation requested
-            if self.confirmModal is not None:
-                if action in ('MENU.TOGGLE', 'RUMBA.ENABLE'):
-                    self.log.debug('Denying confirmation request')
-                    self.state.confirmState = False
-                else:
-                    self.log.debug('Accepting confirmation request')
-                    self.state.confirmState = True
-                self.confirmModal.set()
-                return
-            # toggle menu or map menu key to action
-            if action.startswith('MENU'):
-                index = action.split('.')[1]
-                if index == 'TOGGLE':
-                    if self.state.rumbaActive:
-                        # toggle current menu row
-                        if self.state.confirmTarget is None:
-                            if self.state.menuPage is None:
-                                # start menu with first page..
-                                newPage = 0
-                            else:
-                                newPage = (self.state.menuPage + 1) % len(self.menuRows)
-                            self.updateMenuState(newPage)
-                        else:  # just clear confirm dlg if displayed
-                            self.changeConfirm()
+        if self.recorder is not None:
+            self.recorder.record(action, val)
+        if tracer.current() is None:  # device did not start a trace
+            tracer.begin('input', action=action)
+        self.lastInput = time.monotonic()
+        self.updatePower()  # wake up
+        self.onUserInput(self.state)
+        with tracer.span('onInput', action=action):
+            try:
+                # modal confirmation requested
+                if self.confirmModal is not None:
+                    if action in ('MENU.TOGGLE', 'RUMBA.ENABLE'):
+                        self.log.debug('Denying confirmation request')
+                        self.state.confirmState = False
+                    else:
+                        self.log.debug('Accepting confirmation request')
+                        self.state.confirmState = True
+                    self.confirmModal.set()
+                    return
+                # toggle menu or map menu key to action
+                if self.getAction(action).module == 'MENU':
+                    index = self.getAction(action).func
+                    if index == 'TOGGLE':
+                        if self.state.rumbaActive:
+                            # toggle current menu row
+                            if self.state.confirmTarget is None:
+                                if self.state.menuPage is None:
+                                    # start menu with first page..
+                                    newPage = 0
+                                else:
+                                    newPage = (self.state.menuPage + 1) % len(self.menuRows)
+                                self.updateMenuState(newPage)
+                            else:  # just clear confirm dlg if displayed
+                                self.changeConfirm()
+                        else:
+                            # modal addon active, toggle button acts as 'RUMBA.ENABLE'
+                            action = 'RUMBA.ENABLE'
                     else:
-                        # modal addon active, toggle button acts as 'RUMBA.ENABLE'
-                        action = 'RUMBA.ENABLE'
-                else:
-                    # take action from current menu row (button index starts at 1)
-                    action = self.state.menu[int(index) - 1]
-            # call action
-            if action.startswith('KEY.'):  # inject key(-combo)
-                await self.pressKey(action.split('.', 1)[1])
-            elif action not in ('MENU.TOGGLE', 'MENU.NOTOGGLE'):
-                if self.checkDoubleclick(action):
-                    mod, func = action.split('.')
-                    # loads module if not initialized yet
-                    await self.getModule(mod).do(func, val)
-        except Exception as e:  # pylint: disable=broad-except
-            # catchall - keep running even if action fails
-            self.log.exception('Exception during key handler: %s', e)
+                        # take action from current menu row (button index starts at 1)
+                        action = self.state.menu[int(index) - 1]
+                # queue action
+                if self.getAction(action).module == 'KEY':
+                    self.inputQueue.put(action, val, PRIORITY_KEY, tracer.current())
+                elif action not in ('MENU.TOGGLE', 'MENU.NOTOGGLE'):
+                    priority = PRIORITY_CONFIRM if action == self.state.confirmTarget else PRIORITY_DEFAULT
+                    self.inputQueue.put(action, val, priority, tracer.current())
+            except Exception as e:  # pylint: disable=broad-except
+                # catchall - keep running even if action fails
+                self.log.exception('Exception during key handler: %s', e)
         # hide menu
         if self.state.rumbaActive:  # menu is always displayed during addon sessions (retropie etc)
             self.startMenuTimeout()
 
-    def checkDoubleclick(self, action):
-        """ Returns true if action can be executed """
-        if self.state.requestRunning:
-            return None  # dont start new action while another is still awaited
+    async def processInput(self):
+        """ Task: handles queued user input one after the other """
+        while True:
+            name, val, traceId = await self.inputQueue.get()
+            tracer.resume(traceId)
+            try:
+                with tracer.span('action', action=name):
+                    action = self.getAction(name)
+                    if action.module == 'KEY' or self.checkDoubleclick(action):
+                        self.countUsage(action.module)
+                        await self.runAction(action, val)
+            except asyncio.CancelledError:
+                return
+            except Exception as e:  # pylint: disable=broad-except
+                # catchall - keep running even if action fails
+                self.log.exception('Exception during key handler: %s', e)
+            if self.state.rumbaActive:
+                self.startMenuTimeout()
 
-        if self.state.confirmTarget is not None and self.state.confirmTarget == action:
+    def checkDoubleclick(self, action):
+        """ Returns true if (compiled) action can be executed """
+        if self.state.confirmTarget is not None and self.state.confirmTarget == action.name:
             self.changeConfirm()
             return True  # doubleclick successful
 
-        mod, func = action.split('.')
-        if self.getModule(mod).needsConfirm(func):  # register first click
-            self.changeConfirm(action)  # display confirm dialog
+        if action.module != 'MACRO' and self.getModule(action.module).needsConfirm(action.func):
+            self.changeConfirm(action.name)  # register first click: display confirm dialog
             return False
 
         # action does not require doubleclick
@@ -349,18 +483,7 @@ KERNEL=="uinput", SUBSYSTEM=="misc", OPTIONS+="static_node=uinput", TAG+="uacces
         if moduleName not in self.modules:
             # init module
             try:
-                module = importlib.import_module(f'addons.{moduleName.lower()}')
-
-                cfg = None
-                if moduleName.lower() in self.config['addons']:
-                    cfg = self.config['addons'][moduleName.lower()]
-
-                module = getattr(module, moduleName.capitalize())
-
-                self.modules[moduleName] = module(cfg, self)
-                self.log.debug('registering module %s!', moduleName)
-                self.pm.register(self.modules[moduleName])
-
+                self.initModule(moduleName)
             except ModuleNotFoundError as me:
                 # Most likely a config error
                 self.log.error(me)
@@ -369,6 +492,53 @@ KERNEL=="uinput", SUBSYSTEM=="misc", OPTIONS+="static_node=uinput", TAG+="uacces
                 raise SystemExit from me
         return self.modules[moduleName]
 
+    def initModule(self, moduleName):
+        """ Imports and initializes an addon, raises ModuleNotFoundError on config errors """
+        module = importlib.import_module(f'addons.{moduleName.lower()}')
+
+        cfg = None
+        if moduleName.lower() in self.config['addons']:
+            cfg = self.config['addons'][moduleName.lower()]
+
+        module = getattr(module, moduleName.capitalize())
+
+        self.modules[moduleName] = module(cfg, self)
+        self.keyInjector.register(
+            item[4:] for item in self.modules[moduleName].getMenuItems() if item.startswith('KEY.'))
+        self.keyInjector.register(getattr(self.modules[moduleName], 'KEYS', {}).values())
+        self.log.debug('registering module %s!', moduleName)
+        self.pm.register(self.modules[moduleName])
+
+    async def preloadModules(self):
+        """ Task: addons referenced in the menu rows get imported in a thread and initialized
+            one after the other, most used first - so their first use has no delay
+        """
+        names = {self.getAction(item).module for row in self.menuRows for item in row}
+        names -= {'RUMBA', 'KEY', 'MENU', 'MACRO'}
+        loop = asyncio.get_event_loop()
+        for name in sorted(names, key=lambda name: -self.addonUsage.get(name, 0)):
+            if name in self.modules:
+                continue
+            try:
+                await loop.run_in_executor(None, importlib.import_module, f'addons.{name.lower()}')
+                if name not in self.modules:  # might have been loaded by user input meanwhile
+                    self.initModule(name)
+                    self.log.debug('addon %s preloaded', name)
+            except Exception as e:  # pylint: disable=broad-except
+                # error gets handled again on first use
+                self.log.warning('Preloading addon %s failed: %s', name, e)
+            await asyncio.sleep(0)
+
+    def devicesRegistered(self):
+        """ all devices are registered: addons get preloaded after the next frame """
+        self.devicesReady = True
+        self._queueUpdate(0)
+
+    def countUsage(self, moduleName):
+        """ usage stats of addons, used for the order of preloading """
+        if moduleName not in ('RUMBA', 'KEY', 'MACRO'):
+            self.addonUsage[moduleName] = self.addonUsage.get(moduleName, 0) + 1
+
     def needsConfirm(self, func):
         """ Module Interface: Confirmation for RUMBA.* methods """
         return func in self.CONFIRM
@@ -409,8 +579,9 @@ KERNEL=="uinput", SUBSYSTEM=="misc", OPTIONS+="static_node=uinput", TAG+="uacces
 
         # waiting for server to restore pls
         while not await self.rumba('getStatus', syncronized=False):
-            await asyncio.sleep(0.5)
+            await self.timers.sleep(0.5)
         await self.server.restoreState()
+        self.serverSuspended = False
         self.changeServerRunning(True)
         self.updateMenuState()
         self.log.info('rum.ba jukebox started!')
@@ -418,18 +589,23 @@ KERNEL=="uinput", SUBSYSTEM=="misc", OPTIONS+="static_node=uinput", TAG+="uacces
     async def stop(self):
         """ suspending jukebox server """
         self.log.info('suspending rum.ba jukebox')
+        self.serverSuspended = True  # no 'server not found' alert until started again
 
         self.changeServerRunning()
+        self.server.pauseHistory()
 
-        # save pls and jukebox state
+        # save pls and jukebox state while the service stops
+        saving = None
         if len(self.server.jukebox.curSongs) > 0:
-            self.server.saveState()
+            saving = asyncio.ensure_future(self.server.saveState())
 
         await (
             await asyncio.create_subprocess_exec(
                 'sudo', 'service', 'rumba-server', 'stop',
                 stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
         ).wait()
+        if saving is not None:
+            await saving
         self.log.info('rum.ba jukebox suspended!')
 
     def updateMenuState(self, newPage=None):
@@ -439,30 +615,44 @@ KERNEL=="uinput", SUBSYSTEM=="misc", OPTIONS+="static_node=uinput", TAG+="uacces
         if self.state.rumbaActive:
             # While this controller is active the menu will be constructed
             # from the menuRows in the users config file
-            if newPage is None:
-                self.state.menu = list(self.menuRows[0])
-            else:
-                self.state.menu = list(self.menuRows[newPage])
-
-            for cnt, menuItem in enumerate(self.state.menu):
-                mod, func = menuItem.split('.')
-                if mod not in ('RUMBA', 'KEY'):
-                    self.state.menu[cnt] = self.getModule(mod).getIcon(func)
-                elif func == 'STAR' and self.state.jukebox.curSong and self.state.jukebox.curSong.get('starred', False):
-                    self.state.menu[cnt] = 'RUMBA.UNSTAR'
+            starred = bool(self.state.jukebox.curSong and self.state.jukebox.curSong.get('starred', False))
+            key = (newPage or 0, starred)
+            if key not in self.menuPages:
+                self.menuPages[key] = self.buildMenuPage(*key)
+            self.state.menu = self.menuPages[key]
 
             if self.state.menuPage != newPage:
                 self.state.menuPage = newPage
         else:
             # If a module takes control the menu items are supplied from there
-            self.state.menu = self.state.activeModule.getMenuItems()
+            self.state.menu = tuple(self.state.activeModule.getMenuItems())
             self.state.menuPage = 0
         self.changeConfirm()  # close confirm dlg if present
         self.onToggleMenu(newPage, self.state.menu, self.state)
 
+    def buildMenuPage(self, page, starred):
+        """ Menu items of a page with the icons currently selected by the addons """
+        menu = []
+        for menuItem in self.menuRows[page]:
+            action = self.getAction(menuItem)
+            if action.module not in ('RUMBA', 'KEY', 'MACRO'):
+                menuItem = self.getModule(action.module).getIcon(action.func)
+            elif action.name == 'RUMBA.STAR' and starred:
+                menuItem = 'RUMBA.UNSTAR'
+            menu.append(menuItem)
+        return tuple(menu)
+
+    def invalidateMenu(self):
+        """ Addons need to call this if their icons change (eg running state) """
+        self.menuPages.clear()
+
     def changeRequestRunning(self, running=False):
         """ Changes connection status """
         self.state.requestRunning = running
+        if running:
+            self.requestIdle.clear()
+        else:
+            self.requestIdle.set()
         self.onRequestRunning(running, self.state)
 
     def changeServerRunning(self, running=False):
@@ -471,19 +661,47 @@ KERNEL=="uinput", SUBSYSTEM=="misc", OPTIONS+="static_node=uinput", TAG+="uacces
         self.onServerConnect(running, self.state)
 
     async def changeMode(self, newModule=None):
-        """ Changes currently active module """
+        """ Changes currently active module: when an addon takes over from the jukebox
+            the server gets stopped while the addon is already starting (eg the emulator
+            launches while the jukebox server winds down). Returning to the jukebox waits
+            for the addon to release audio and display. The new module becomes active and
+            its menu is shown as soon as its start returned.
+            The timing of every transition is logged and kept in lastTransition
+        """
         if not self.state.requestRunning:
             self.changeRequestRunning(True)
-
-            if self.state.activeModule is not None:
-                await self.state.activeModule.stop()
-            self.state.activeModule = self if newModule is None else newModule
-            self.updateMenuState()
-            await self.state.activeModule.start()
-            self.updateMenuState()
-            self.onModeChange(self.state.activeModule, self.state)
-
-            self.changeRequestRunning()
+            oldModule = self.state.activeModule
+            newModule = self if newModule is None else newModule
+            began = time.monotonic()
+            timing = {'from': getattr(oldModule, 'name', None), 'to': newModule.name}
+
+            async def step(name, coro):
+                """ runs a step of the transition, records its duration """
+                start = time.monotonic()
+                with tracer.span(f'mode.{name}', module=newModule.name):
+                    await coro
+                timing[name] = round(time.monotonic() - start, 3)
+
+            stopping = None
+            try:
+                if oldModule is self and newModule is not self:  # server stops while the addon starts
+                    stopping = asyncio.ensure_future(step('stop', oldModule.stop()))
+                elif oldModule is not None:
+                    await step('stop', oldModule.stop())
+                try:
+                    await step('start', newModule.start())
+                    self.state.activeModule = newModule
+                    self.updateMenuState()
+                    self.onModeChange(newModule, self.state)
+                    timing['ready'] = round(time.monotonic() - began, 3)
+                finally:
+                    if stopping is not None:
+                        await stopping
+                timing['total'] = round(time.monotonic() - began, 3)
+                self.lastTransition = timing
+                self.log.info('mode change %s -> %s: %s', timing['from'], timing['to'], timing)
+            finally:
+                self.changeRequestRunning()
 
     async def resetMode(self):
         """ Resets currently active module """
@@ -516,8 +734,8 @@ KERNEL=="uinput", SUBSYSTEM=="misc", OPTIONS+="static_node=uinput", TAG+="uacces
         if self.state.confirmTarget != action:
             self.state.confirmTarget = action
             if action is not None:
-                mod, func = action.split('.')
-                self.state.confirmText = self.getModule(mod).getConfirmText(func)
+                compiled = self.getAction(action)
+                self.state.confirmText = self.getModule(compiled.module).getConfirmText(compiled.func)
             else:
                 self.state.confirmText = None
             self.onToggleConfirm(action, self.state.confirmText, False, self.state)
@@ -533,19 +751,71 @@ KERNEL=="uinput", SUBSYSTEM=="misc", OPTIONS+="static_node=uinput", TAG+="uacces
         """ start/reset timeout to hide menu """
         if self.menuTimer is not None:
             self.menuTimer.cancel()
-        self.menuTimer = asyncio.get_event_loop().call_later(self.menuTimeout, self.resetMenu)
+        self.menuTimer = self.timers.callLater(self.menuTimeout, self.resetMenu, slack=0.5)
         self.log.debug('hide menu timer started')
 
     def setDisplayResolution(self, resolution):
         """ Sets album art resolution for img-fetches in server connector """
         self.server.displayRes = resolution
         self.log.debug('Resolution for album art changed (%s)', resolution)
+        if self.state.jukebox.curSong is not None:  # first sync finished before display init
+            self.server.setCurSong()  # fetch cover
 
     def serverCallback(self, changed):
         """ ui updates on jukebox state change """
         if changed in (jukebox.CHANGE.PLS, jukebox.CHANGE.TRACK):
             self.log.debug('server callback (change: %s)', changed)
             self.onTrackChange(self.state.jukebox.curPos, self.state.jukebox.curSong, self.state)
+        elif changed == jukebox.CHANGE.PLAY:
+            self.log.debug('server callback (change: %s)', changed)
+            self.onTogglePlaying(self.state.jukebox.playing, self.state)
+
+    def getHookStats(self):
+        """ rolling timing stats of plugin hooks, empty if monitoring is disabled """
+        return self.hookMonitor.getStats() if self.hookMonitor is not None else {}
+
+    def getLoopStats(self):
+        """ event loop scheduling delay percentiles, empty if monitoring is disabled """
+        return self.loopMonitor.getStats() if self.loopMonitor is not None else {}
+
+    def getMetrics(self):
+        """ all runtime metrics (eg for io.socket clients) """
+        return {
+            'stateVersion': self.state.version,
+            'power': self.state.power,
+            'powerStats': self.powerStats,
+            'inputQueue': {'pending': len(self.inputQueue), 'dropped': self.inputQueue.dropped},
+            'timers': self.timers.getStats(),
+            'hooks': self.getHookStats(),
+            'loop': self.getLoopStats(),
+            'addonUsage': self.addonUsage,
+            'modeTransition': self.lastTransition,
+        }
+
+    def _queueUpdate(self, change):
+        """ collects state changes: events fired in a row by one action
+            (eg request stopped, track changed, menu updated) result
+            in a single onUpdate with the merged change mask
+        """
+        self.pendingUpdates |= change
+        if self.updateHandle is None:
+            if self.frameBudget > 0:
+                self.updateHandle = asyncio.get_event_loop().call_later(self.frameBudget, self._flushUpdates)
+            else:  # next loop iteration
+                self.updateHandle = asyncio.get_event_loop().call_soon(self._flushUpdates)
+
+    def _flushUpdates(self):
+        """ emits collected state changes """
+        changes = self.pendingUpdates
+        self.pendingUpdates = 0
+        self.updateHandle = None
+        if self.preloadAddons and self.preloadTask is None and self.devicesReady:  # start preloading addons
+            self.preloadTask = asyncio.ensure_future(self.preloadModules())
+        if changes:
+            delta = self.state.commitChanges()
+            if delta:
+                self.onStateDelta(delta, self.state)
+            self.onUpdate(changes, self.state)
 
     ########################### Events/Plugins ##########################
     # all hooks for output-devices send full controller state
@@ -562,74 +832,143 @@ KERNEL=="uinput", SUBSYSTEM=="misc", OPTIONS+="static_node=uinput", TAG+="uacces
         """ Triggers on every user input eg for controlling a screensaver """
         self.pm.hook.onUserInput(state=state)
         self.log.debug('hook triggered: onUserInput()')
+        self._queueUpdate(UPDATE.INPUT)
 
     @hookspec
     def onToggleMenu(self, menuPage, menu, state):
         """ Triggers every time the menu page changes """
         self.pm.hook.onToggleMenu(menuPage=menuPage, menu=menu, state=state)
         self.log.debug('hook triggered: onToggleMenu(%s)', menuPage)
+        self._queueUpdate(UPDATE.MENU)
 
     @hookspec
     def onToggleVideo(self, videoOut, state):
         """ Triggers every time video output changes """
         self.pm.hook.onToggleVideo(videoOut=videoOut, state=state)
         self.log.debug('hook triggered: onToggleVideo(%s)', videoOut)
+        self._queueUpdate(UPDATE.VIDEO)
 
     @hookspec
     def onTrackChange(self, curPos, curSong, state):
         """ Triggers every time the played track changes """
         self.pm.hook.onTrackChange(curPos=curPos, curSong=curSong, state=state)
         self.log.debug('hook triggered: onTrackChange(%s)', curSong)
+        self._queueUpdate(UPDATE.TRACK)
 
     @hookspec
     def onPosChange(self, curPos, curSong, state):
         """ Triggers every time the playback position changes (polled with 1 second interval) """
         self.pm.hook.onPosChange(curPos=curPos, curSong=curSong, state=state)
         self.log.debug('hook triggered: onPosChange(%s, %s)', curSong['duration'], curPos)
+        self._queueUpdate(UPDATE.POS)
 
     @hookspec
     def onRequestRunning(self, started, state):
         """ Triggers every time a request to the server starts or stops """
         self.pm.hook.onRequestRunning(started=started, state=state)
         self.log.debug('hook triggered: onRequestRunning(%s)', started)
+        self._queueUpdate(UPDATE.REQUEST)
 
     @hookspec
     def onServerConnect(self, connected, state):
         """ Triggers every time the jukebox server is started or stopped """
         self.pm.hook.onServerConnect(connected=connected, state=state)
         self.log.debug('hook triggered: onServerConnect(%s)', connected)
+        self._queueUpdate(UPDATE.SERVER)
 
     @hookspec
     def onModeChange(self, newModule, state):
         """ Triggers every time an addon takes or returns exclusive control """
         self.pm.hook.onModeChange(newModule=newModule, state=self.state)
         self.log.debug('hook triggered: onModeChange(%s)', newModule.name)
+        self._queueUpdate(UPDATE.MODE)
 
     @hookspec
     def onTogglePlaying(self, playing, state):
         """ Triggers every time playback changes (play/pause) """
         self.pm.hook.onTogglePlaying(playing=playing, state=state)
         self.log.debug('hook triggered: onTogglePlaying(%s)', playing)
+        self._queueUpdate(UPDATE.PLAY)
 
     @hookspec
     def onToggleAlert(self, text, state):
         """ Triggers every time an alert needs to be shown or ends (eg server not found) """
         self.pm.hook.onToggleAlert(text=text, state=state)
         self.log.debug('hook triggered: onToggleAlert(%s)', text)
+        self._queueUpdate(UPDATE.ALERT)
 
     @hookspec
     def onToggleConfirm(self, action, confirmText, confirmModal, state):
         """ Triggers every time a confirmation needs to be shown or ends ('doublecklick') """
         self.pm.hook.onToggleConfirm(action=action, confirmText=confirmText, confirmModal=confirmModal, state=state)
         self.log.debug('hook triggered: onToggleConfirm(%s)', action)
+        self._queueUpdate(UPDATE.CONFIRM)
+
+    @hookspec
+    def onStateDelta(self, changes, state):
+        """ Triggers once after all events of one action/loop iteration if state has changed,
+            changes is a set with the names of the changed fields
+            (pos, track, play, menu, confirm, alert, request, mode - see State.trackedFields)
+            and state.version is incremented with every delta
+        """
+        self.pm.hook.onStateDelta(changes=changes, state=state)
+        self.log.debug('hook triggered: onStateDelta(%s)', sorted(changes))
+
+    @hookspec
+    def onUpdate(self, changes, state):
+        """ Triggers once after all events of one action/loop iteration,
+            changes is a bitmask of UPDATE flags for all events since the last onUpdate
+            eg for rendering all changes at once
+        """
+        self.pm.hook.onUpdate(changes=changes, state=state)
+        self.log.debug('hook triggered: onUpdate(%s)', changes)
+
+    @hookspec
+    def onPowerState(self, power, state):
+        """ Triggers every time the power state changes (active, idle, sleep - see POWER),
+            plugins should slow down or suspend periodic work (clock, animations, leds) while not active
+        """
+        self.pm.hook.onPowerState(power=power, state=state)
+        self.log.debug('hook triggered: onPowerState(%s)', power)
+        self._queueUpdate(UPDATE.POWER)
 
     @hookspec
     def onClose(self):
         """ Shutdown triggered, stop running tasks """
         self.log.debug('hook triggered: onClose()')
-        self.statusTask.cancel()
+        if self.statusTask is not None:
+            self.statusTask.cancel()
+        if self.inputTask is not None:
+            self.inputTask.cancel()
+        if self.preloadTask is not None:
+            self.preloadTask.cancel()
+        if self.addonUsage:
+            try:
+                writeState(self.usageFile, self.addonUsage)
+            except OSError as oe:
+                self.log.warning('Saving addon usage failed: %s', oe)
         if self.menuTimer is not None:
             self.menuTimer.cancel()
+        if self.updateHandle is not None:
+            self.updateHandle.cancel()
         self.keyInjector.close()
+        self.server.close()
+        if self.recorder is not None:
+            self.recorder.close()
         self.pm.hook.onClose()
+        self.log.info('timers: %s', self.timers.getStats())
+        self.log.info('power states (seconds, timer wakeups): %s', self.powerStats)
+        # hook monitoring gets removed in reverse order of installation (pluggy undo is LIFO)
+        if self.traceFile:
+            tracer.close()
+            try:
+                tracer.export(self.traceFile)
+            except OSError as oe:
+                self.log.warning('Writing trace failed: %s', oe)
+        if self.hookMonitor is not None:
+            self.log.info('hook timing (ms): %s', self.getHookStats())
+            self.hookMonitor.close()
+        if self.loopMonitor is not None:
+            self.log.info('event loop lag (ms): %s', self.getLoopStats())
+            self.loopMonitor.close()
         asyncio.get_event_loop().stop()
@@ -0,0 +1 @@
+# vendored DBussy (dbussy/ravel) by Lawrence D'Oliveiro, shared by addons and devices using d-bus
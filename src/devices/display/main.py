@@ -1,30 +1,57 @@
 import asyncio
+import copy
+import dataclasses
 import logging
 import datetime
 import math
 from pathlib import Path
+from typing import Any, Optional, Tuple
 import pluggy
 import pygame
+from monitor import tracer
+from server import Playlist
 from . import pygameUI
+from ..worker import createWorker, FULL
 
 # needs pygame package installed
 # implements onRequestRunning, onToggleAlert, onToggleConfirm, onToggleMenu,
-# onTrackChange, onPosChange, onTogglePlaying and onClose
+# onTrackChange, onPosChange, onTogglePlaying, onStateDelta, onUpdate and onClose
 hookimpl = pluggy.HookimplMarker("rumba-remote")
 
 
+@dataclasses.dataclass(frozen=True)
+class RenderState:
+    """ Copy of everything the ui renders for the render worker, taken on the event loop:
+        song data gets copied and values depending on the active module are resolved,
+        the worker thread never touches live controller state
+    """
+    jukebox: Any  # JukeboxState without playlist
+    menu: Optional[Tuple[str, ...]]
+    menuPage: Optional[int]
+    confirmState: Optional[bool]
+    confirmTarget: Optional[str]
+    confirmText: str
+    alert: str
+    bgImage: Optional[str]
+    rumbaActive: bool
+    toggleAction: str
+
+
 class Handler():
     """ Handles display devices with or without touch input
 
         Listens to most of the controller events because almost every
         info should get rendered on the display - the handler decides
         if a full redraw of the display is necessary and does partial
-        updates when possible.
+        updates when possible. Events only mark what needs to be redrawn,
+        rendering happens once per merged controller update (onUpdate)
 
         The handler also controls a screen saver that can display slides
         while the jukebox is paused and updates a clock shown on the
         display all the time
     """
+    THREADED = False  # rendering in a worker thread needs 'threaded = True' in the config (see worker.createWorker)
+
     def __init__(self, config, controller, loop):
 
         self.device = config['type']
@@ -36,11 +63,15 @@ class Handler():
 
         # direct access to controller state: needed for ui-redraw on internal trigger (screensaver/clock)
         self.ctrlState = controller.state
+        self.timers = controller.timers  # shared timers with slack (saves wakeups)
 
         # activate screensaver only if slides found
         self.scrnsvrActivated = False  # screensaver in use
         self.scrnsvrRunning = False  # screensaver showing slides
         self.scrnsvrTimer = None  # next slide timeout running
+        self.redrawPending = False  # full redraw on next onUpdate
+        self.menuPending = False  # partial menu redraw on next onUpdate
+        self.stateDelta = frozenset()  # fields changed since last onUpdate
 
         slideShowImgs = []
         if config.get('slideshowDir') is not None:
@@ -58,8 +89,10 @@ class Handler():
         # init ui
         self.ui = pygameUI.Display(config, controller.appDir, slideShowImgs)
         controller.setDisplayResolution(self.ui.getDisplayResolution())
+        # render in own thread: keeps the event loop responsive while the display is updated
+        self.worker = createWorker(self, config, 'display.render')
         if self.scrnsvrActivated:
-            self.scrnsvrTimer = asyncio.get_event_loop().call_later(0.01, self.updateSlide)
+            self.scrnsvrTimer = self.timers.callLater(0.01, self.updateSlide)
 
         # implement touch here because of its shared state with the display
         if config.getboolean('touch', fallback=False):
@@ -84,8 +117,8 @@ class Handler():
         while True:
             await self.requestRunning.wait()  # blocks
             # partial update possible bc animated part fully covers the previous one
-            self.ui.animateLoader()
-            await asyncio.sleep(.05)
+            self.render('loader', self.ui.animateLoader)
+            await self.timers.sleep(.05)
 
     async def clockTimer(self):
         """ Task: update clock display every 60 seconds """
@@ -93,14 +126,14 @@ class Handler():
             # full ui update needed
             self.redrawUI(self.ctrlState)
             # kinda self adjusting - no need for accuracy here
-            await asyncio.sleep(int(60 - datetime.datetime.now().second))
+            await self.timers.sleep(int(60 - datetime.datetime.now().second), slack=1)
 
     def updateSlide(self):
         """ Show next slide and restart slideshow update task """
         self.log.debug('updating background with next slide')
         self.scrnsvrRunning = True
         # full ui update needed
-        self.ui.nextSlide(self.ctrlState)
+        self.render(FULL, self.ui.nextSlide, self.snapshot(self.ctrlState))
         self.startScrnsvrTimeout()
 
     def startScrnsvrTimeout(self):
@@ -108,7 +141,7 @@ class Handler():
         if self.scrnsvrTimer is not None:
             self.scrnsvrTimer.cancel()
         if self.ctrlState.rumbaActive and not self.ctrlState.jukebox.playing:
-            self.scrnsvrTimer = asyncio.get_event_loop().call_later(self.scrnsvrTimeout, self.updateSlide)
+            self.scrnsvrTimer = self.timers.callLater(self.scrnsvrTimeout, self.updateSlide, slack=1)
             self.log.debug('next slide timer started')
         else:
             self.scrnsvrRunning = False
@@ -121,14 +154,32 @@ class Handler():
             self.scrnsvrTimer.cancel()
         self.scrnsvrRunning = False
 
+    def render(self, key, func, *args):
+        """ run ui update directly or pass it to the render worker """
+        func = tracer.wrap(func, f'render.{key}')
+        if self.worker is not None:
+            self.worker.submit(key, func, *args)
+        else:
+            func(*args)
+
+    def snapshot(self, state):
+        """ copy of the state for the render worker, the controller keeps changing the original """
+        if self.worker is None:
+            return state
+        jukebox = dataclasses.replace(  # playlist is not rendered, song dicts get updated in place (hydration, cover)
+            state.jukebox, curSongs=Playlist(), curSong=copy.deepcopy(state.jukebox.curSong))
+        return RenderState(
+            jukebox, state.menu, state.menuPage, state.confirmState, state.confirmTarget,  # menu is a tuple
+            state.confirmText, state.alert, state.bgImage, state.rumbaActive, state.toggleAction)
+
     def redrawUI(self, state):
         """ update jukebox state or slideshow image """
         if self.scrnsvrRunning:
             self.log.debug('redraw UI (slideshow)')
-            self.ui.updateSlide(state)
+            self.render(FULL, self.ui.updateSlide, self.snapshot(state))
         else:
             self.log.debug('redraw UI')
-            self.ui.update(state)
+            self.render(FULL, self.ui.update, self.snapshot(state))
 
     def pygameEventLoop(self, loop):
         """ touch event listener. because wait() is blocking,
@@ -225,19 +276,18 @@ class Handler():
         else:
             self.log.debug('stopping loader animation')
             self.requestRunning.clear()
-            self.redrawUI(state)
+            self.redrawPending = True
 
     @hookimpl
     def onServerConnect(self, connected, state):
         """ Connection to the jukebox server is available/lost """
         if connected:
             self.log.debug('rumba started, enable screensaver')
-            self.redrawUI(state)
             self.startScrnsvrTimeout()
         else:
             self.log.debug('external module started, disable screensaver')
             self.stopScrnsvr()
-        self.redrawUI(state)
+        self.redrawPending = True
 
     @hookimpl
     def onModeChange(self, newModule, state):
@@ -250,17 +300,17 @@ class Handler():
                 self.stopScrnsvr()
             else:
                 self.startScrnsvrTimeout()
-        self.redrawUI(state)
+        self.redrawPending = True
 
     @hookimpl
     def onTrackChange(self, curPos, curSong, state):
         """ Played track changes """
-        self.redrawUI(state)
+        self.redrawPending = True
 
     @hookimpl
     def onPosChange(self, curPos, curSong, state):
         """ Playback position changes (partial update) """
-        self.ui.updatePos(curPos, curSong['duration'])
+        self.render('pos', self.ui.updatePos, curPos, curSong['duration'])
 
     @hookimpl
     def onTogglePlaying(self, playing, state):
@@ -274,11 +324,12 @@ class Handler():
 
     @hookimpl
     def onUserInput(self, state):
-        """ Screensaver gets restarted on every user input """
+        """ Screensaver gets restarted on every user input, the ui is only redrawn when waking up from slides """
         if self.scrnsvrActivated and not state.jukebox.playing and state.jukebox.curSongs:
             self.log.debug('restarting screensaver')
+            if self.scrnsvrRunning:
+                self.redrawPending = True
             self.stopScrnsvr()
-            self.redrawUI(state)
             self.startScrnsvrTimeout()
 
     @hookimpl
@@ -286,21 +337,50 @@ class Handler():
         """ The menu is shown/hidden or menu page changes """
         self.log.debug('toggle menu: %s - no %s', menu, menuPage)
         if menuPage is None:
-            self.redrawUI(state)
+            self.redrawPending = True
         else:
-            self.ui.updateMenu(menu, state.toggleAction, state.confirmState)
+            self.menuPending = True
         if self.scrnsvrActivated:
             self.startScrnsvrTimeout()
 
     @hookimpl
     def onToggleAlert(self, text, state):
         """ An alert needs to be shown or ends (eg server not found) """
-        self.redrawUI(state)
+        self.redrawPending = True
 
     @hookimpl
     def onToggleConfirm(self, action, confirmText, confirmModal, state):
         """ Confirmation needs to be shown or ends ('doublecklick') """
-        self.redrawUI(state)
+        self.redrawPending = True
+
+    @hookimpl
+    def onPowerState(self, power, state):
+        """ Power state changes: clock and slideshow are suspended while asleep """
+        if power == 'sleep':
+            self.log.debug('sleeping, suspending clock and slideshow')
+            self.clockTask.cancel()
+            self.stopScrnsvr()
+        elif self.clockTask.done():
+            self.log.debug('waking up, resuming clock and slideshow')
+            self.clockTask = asyncio.ensure_future(self.clockTimer())  # redraws right away
+            if self.scrnsvrActivated:
+                self.startScrnsvrTimeout()
+
+    @hookimpl
+    def onStateDelta(self, changes, state):
+        """ Changed fields, always sent right before onUpdate """
+        self.stateDelta = changes
+
+    @hookimpl
+    def onUpdate(self, changes, state):
+        """ All events of one action are done: single (full or partial) redraw """
+        if self.redrawPending:
+            self.redrawUI(state)  # includes menu
+        elif self.menuPending and self.stateDelta & {'menu', 'confirm'} and state.menuPage is not None:
+            # same page shown again (eg menu timer reset) needs no redraw
+            self.render('menu', self.ui.updateMenu, state.menu, state.toggleAction, state.confirmState)
+        self.redrawPending = self.menuPending = False
+        self.stateDelta = frozenset()
 
     @hookimpl
     def onClose(self):
@@ -310,6 +390,8 @@ class Handler():
         self.loaderTask.cancel()
         if self.scrnsvrTimer is not None:
             self.scrnsvrTimer.cancel()
+        if self.worker is not None:
+            self.worker.close()
         if getattr(self, 'eventTask', False):
             pygame.event.post(pygame.event.Event(pygame.QUIT))
             pygame.event.pump()
@@ -56,6 +56,7 @@ class Display():
                 self.displaySize = (res[0], res[1])
                 self.log.info('Using screen resolution from config: %s', self.displaySize)
         self.toggleAlignLeft = config.getboolean('toggleAlignLeft', fallback=True)
+        self.menuCache = None  # last rendered menu pane
         # init display & GUI
         if config.get('envSDL') is not None:
             os.environ["SDL_VIDEODRIVER"] = config.get('envSDL')
@@ -180,7 +181,13 @@ class Display():
             self.log.error('ui.updateMenu() called without menu!')
 
     def drawMenu(self, menu, toggleAction, confirmModal=None, target=None):
-        """ creates new menu pane """
+        """ creates new menu pane, the last pane gets reused if the menu did not change """
+        cacheKey = (tuple(menu), toggleAction, confirmModal)
+        if self.menuCache is not None and self.menuCache[0] == cacheKey:
+            btnBG = self.menuCache[1]
+            if target is not None:
+                target.blit(btnBG, (0, self.displaySize[1] - self.pxH(20)))
+            return btnBG
         btnBG = pygameUtil.roundRect(
             (self.displaySize[0], self.pxH(20)),
             WHITE, rad=self.pxH(2),
@@ -190,7 +197,7 @@ class Display():
         # XXX: add a check and feedback when parsing config?
         iconWidth = 100 // (len(menu) + 1)
         if confirmModal is None:
-            fullMenu = menu.copy()
+            fullMenu = list(menu)
             if self.toggleAlignLeft:
                 fullMenu.insert(0, toggleAction)  # prepend toggle button
             else:
@@ -207,6 +214,7 @@ class Display():
                  (4 * self.pxW(iconWidth)), self.pxH(12)),
                 sysfontname="DejaVuSans", surf=btnBG
             )
+        self.menuCache = (cacheKey, btnBG)
         if target is not None:
             target.blit(btnBG, (0, self.displaySize[1] - self.pxH(20)))
         return btnBG
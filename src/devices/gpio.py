@@ -2,9 +2,10 @@ import asyncio
 import logging
 import RPi.GPIO as GPIO  # type: ignore
 import pluggy
+from monitor import tracer
 
 # needs RPi.GPIO package installed
-# implements onClose, onToggleMenu, onToggleVideo, onRequestRunning, onToggleConfirm and onServerConnected
+# implements onClose, onStateDelta, onToggleVideo, onRequestRunning, onToggleConfirm and onServerConnected
 hookimpl = pluggy.HookimplMarker("rumba-remote")
 
 
@@ -90,6 +91,7 @@ class Handler():
         """
         val = GPIO.input(pin) if pin is not None else None
         self.log.debug('pressed gpio key: %s(%s)', func, (val if pin is not None else ""))
+        tracer.begin('input.gpio', action=func, pin=pin)
         asyncio.ensure_future(self.inputHandler.onInput(func, val))
 
     async def _blink(self, effect='blink'):
@@ -100,18 +102,18 @@ class Handler():
                 if effect == 'blink':
                     for pin in self.outputsMenu:
                         GPIO.output(pin, GPIO.HIGH)
-                    await asyncio.sleep(0.05)  # short pause in case there is only 1 led available
+                    await self.inputHandler.timers.sleep(0.05)  # short pause in case there is only 1 led available
                     GPIO.output(self.outputsMenu[cntr % len(self.outputsMenu)], GPIO.LOW)
                     cntr += 1
-                    await asyncio.sleep(0.4)
+                    await self.inputHandler.timers.sleep(0.4)
                 else:  # pulse
                     cntr += 1
                     for pin in self.outputsMenu:
                         GPIO.output(pin, GPIO.LOW if cntr % 2 else GPIO.HIGH)
-                    await asyncio.sleep(0.5 if cntr % 2 else 0.2)
+                    await self.inputHandler.timers.sleep(0.5 if cntr % 2 else 0.2)
         except asyncio.CancelledError:
-            for pin in self.outputsMenu:
-                GPIO.output(pin, GPIO.HIGH)
+            if self.blinkTask is not None:  # effect ended: back to menu page leds (leds stay off on shutdown)
+                self._showMenuPage(self.inputHandler.state.menuPage)
 
     async def _switchLightEffect(self, effect, start=False):
         """ stops current effect if running and starts a new one """
@@ -145,8 +147,14 @@ class Handler():
             GPIO.output(self.outputs['RUMBA.VIDEO'], GPIO.LOW if videoOut else GPIO.HIGH)
 
     @hookimpl
-    def onToggleMenu(self, menuPage):
-        """ visual feedback for currently active menu page
+    def onPowerState(self, power):
+        """ no light effects while asleep """
+        if power == 'sleep':
+            asyncio.ensure_future(self._switchLightEffect(None))
+
+    @hookimpl
+    def onStateDelta(self, changes, state):
+        """ visual feedback for currently active menu page (skipped if menu unchanged)
             page 0: no leds
             page 1: 1 led
             page 2: 2 leds etc
@@ -154,13 +162,17 @@ class Handler():
             the max number of available leds will be lit
             eg. menupage 3 will only light 2 leds if no more are available
         """
-        if self.outputsMenu:
-            self.log.debug('toggle menu: %s (gpio)', menuPage)
-            for pin in self.outputsMenu:
-                GPIO.output(pin, GPIO.HIGH)
-            if menuPage is not None and menuPage > 0:
-                for i in range(0, min(menuPage, len(self.outputsMenu))):
-                    GPIO.output(self.outputsMenu[i], GPIO.LOW)
+        if 'menu' in changes and self.outputsMenu:
+            self.log.debug('toggle menu: %s (gpio)', state.menuPage)
+            self._showMenuPage(state.menuPage)
+
+    def _showMenuPage(self, menuPage):
+        """ lights one led per menu page no (see onStateDelta) """
+        for pin in self.outputsMenu:
+            GPIO.output(pin, GPIO.HIGH)
+        if menuPage is not None and menuPage > 0:
+            for i in range(0, min(menuPage, len(self.outputsMenu))):
+                GPIO.output(self.outputsMenu[i], GPIO.LOW)
 
     @hookimpl
     def onToggleConfirm(self, action):
@@ -181,6 +193,9 @@ class Handler():
             turn off leds and gpio release
         """
         self.log.debug('Shutdown, cleanup gpio pins')
+        if self.blinkTask is not None:
+            blinkTask, self.blinkTask = self.blinkTask, None
+            blinkTask.cancel()
         for output in self.outputs.values():
             GPIO.output(output, GPIO.HIGH)
         GPIO.cleanup()
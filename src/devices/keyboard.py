@@ -3,9 +3,10 @@ import logging
 import evdev
 import pluggy
 from config import ConfigError
+from monitor import tracer
 
 # needs evdev package installed
-# implements onClose, onToggleMenu, onToggleVideo, onRequestRunning, onToggleConfirm and onServerConnected
+# implements onClose, onStateDelta, onToggleVideo, onRequestRunning, onToggleConfirm and onServerConnected
 hookimpl = pluggy.HookimplMarker("rumba-remote")
 
 
@@ -119,6 +120,7 @@ class Handler():
                         self.log.debug(
                             'pressed key %s - %s (%s)',
                             e.keycode, e.scancode, configuredInputs[e.scancode])
+                        tracer.begin('input.keyboard', action=configuredInputs[e.scancode], key=e.keycode)
                         asyncio.ensure_future(self.controller.onInput(configuredInputs[e.scancode]))
                     except Exception as e:  # pylint: disable=broad-except
                         # catchall to avoid getting unresponsive
@@ -132,23 +134,22 @@ class Handler():
                 if effect == 'blink':
                     for led in self.outputsMenu:
                         self.device.set_led(led, 0)
-                    await asyncio.sleep(0.05)  # short pause in case there is only 1 led available
+                    await self.controller.timers.sleep(0.05)  # short pause in case there is only 1 led available
                     self.device.set_led(self.outputsMenu[cntr % len(self.outputsMenu)], 1)
                     cntr += 1
-                    await asyncio.sleep(0.4)
+                    await self.controller.timers.sleep(0.4)
                 else:  # pulse
                     cntr += 1
                     for led in self.outputsMenu:
                         self.device.set_led(led, cntr % 2)
-                    await asyncio.sleep(0.5 if cntr % 2 else 0.2)
+                    await self.controller.timers.sleep(0.5 if cntr % 2 else 0.2)
         except (OSError, AttributeError):
             self.log.warning('usb-disconnect: %s', self.device)
             self.device = None
             return False  # stop this timer
         except asyncio.CancelledError:
-            if self.device is not None:
-                for led in self.outputsMenu:
-                    self.device.set_led(led, 0)
+            if self.blinkTask is not None:  # effect ended: back to menu page leds (leds stay off on shutdown)
+                self._showMenuPage(self.controller.state.menuPage)
 
     async def _switchLightEffect(self, effect, start=False):
         """ stops current effect if running and starts a new one """
@@ -183,8 +184,14 @@ class Handler():
             self.device.set_led(self.outputs['RUMBA.VIDEO'], videoOut)
 
     @hookimpl
-    def onToggleMenu(self, menuPage):
-        """ visual feedback for currently active menu page
+    def onPowerState(self, power):
+        """ no light effects while asleep """
+        if power == 'sleep':
+            asyncio.ensure_future(self._switchLightEffect(None))
+
+    @hookimpl
+    def onStateDelta(self, changes, state):
+        """ visual feedback for currently active menu page (skipped if menu unchanged)
             page 0: no leds
             page 1: 1 led
             page 2: 2 leds etc
@@ -192,17 +199,23 @@ class Handler():
             the max number of available leds will be lit
             eg. menupage 3 will only light 2 leds if no more are available
         """
-        if self.outputsMenu and self.device is not None:
-            self.log.debug('toggle menu: %s (%s)', menuPage, self.device)
-            try:
-                for led in self.outputsMenu:
-                    self.device.set_led(led, 0)
-                if menuPage is not None and menuPage > 0:
-                    for i in range(0, min(menuPage, len(self.outputsMenu))):
-                        self.device.set_led(self.outputsMenu[i], 1)
-            except (OSError, AttributeError):
-                self.log.warning('usb-disconnect: %s', self.device)
-                self.device = None
+        if 'menu' in changes and self.outputsMenu and self.device is not None:
+            self.log.debug('toggle menu: %s (%s)', state.menuPage, self.device)
+            self._showMenuPage(state.menuPage)
+
+    def _showMenuPage(self, menuPage):
+        """ lights one led per menu page no (see onStateDelta) """
+        if self.device is None:
+            return
+        try:
+            for led in self.outputsMenu:
+                self.device.set_led(led, 0)
+            if menuPage is not None and menuPage > 0:
+                for i in range(0, min(menuPage, len(self.outputsMenu))):
+                    self.device.set_led(self.outputsMenu[i], 1)
+        except (OSError, AttributeError):
+            self.log.warning('usb-disconnect: %s', self.device)
+            self.device = None
 
     @hookimpl
     def onToggleConfirm(self, action):
@@ -228,6 +241,7 @@ class Handler():
                 if self.blinkTask is not None:
                     self.log.debug('stoping light effect (%s)', self.device)
                     self.blinkTask.cancel()
+                    self.blinkTask = None
                     # await self.blinkTask
                     # asyncio.ensure_future(self.blinkTask)
                 for output in self.outputs.values():
@@ -0,0 +1,262 @@
+import asyncio
+import logging
+import pluggy
+from dbusbinding import ravel
+from monitor import tracer
+
+hookimpl = pluggy.HookimplMarker("rumba-remote")
+
+PATH = '/org/mpris/MediaPlayer2'
+ROOT = 'org.mpris.MediaPlayer2'
+PLAYER = 'org.mpris.MediaPlayer2.Player'
+
+
+@ravel.interface(ravel.INTERFACE.SERVER, name=ROOT)
+class MediaPlayer2():
+    """ MPRIS root interface, the remote has no window to raise and can't be quit by clients """
+    def __init__(self, handler):
+        self.handler = handler
+
+    @ravel.method(name='Raise', in_signature='', out_signature='')
+    def raiseWindow(self):
+        """ no window """
+
+    @ravel.method(name='Quit', in_signature='', out_signature='')
+    def quit(self):
+        """ not supported (CanQuit) """
+
+    @ravel.propgetter(name='CanQuit', type='b')
+    def canQuit(self):
+        """ clients can't quit the remote """
+        return False
+
+    @ravel.propgetter(name='CanRaise', type='b')
+    def canRaise(self):
+        """ no window to raise """
+        return False
+
+    @ravel.propgetter(name='HasTrackList', type='b')
+    def hasTrackList(self):
+        """ no TrackList interface """
+        return False
+
+    @ravel.propgetter(name='Identity', type='s')
+    def identity(self):
+        """ configured player name """
+        return self.handler.identity
+
+    @ravel.propgetter(name='SupportedUriSchemes', type='as')
+    def supportedUriSchemes(self):
+        """ OpenUri is not supported """
+        return []
+
+    @ravel.propgetter(name='SupportedMimeTypes', type='as')
+    def supportedMimeTypes(self):
+        """ OpenUri is not supported """
+        return []
+
+
+@ravel.interface(ravel.INTERFACE.SERVER, name=PLAYER)
+class Player():  # pylint: disable=too-many-public-methods
+    """ MPRIS player interface backed by the controller state,
+        control goes through onInput like every other input device
+    """
+    def __init__(self, handler):
+        self.handler = handler
+
+    @ravel.method(name='Next', in_signature='', out_signature='')
+    def next(self):
+        """ next song, wraps at the end of the playlist """
+        self.handler.input('RUMBA.NEXT')
+
+    @ravel.method(name='Previous', in_signature='', out_signature='')
+    def previous(self):
+        """ previous song """
+        self.handler.input('RUMBA.PREV')
+
+    @ravel.method(name='PlayPause', in_signature='', out_signature='')
+    def playPause(self):
+        """ toggle playback """
+        self.handler.input('RUMBA.PLAYPAUSE')
+
+    @ravel.method(name='Play', in_signature='', out_signature='')
+    def play(self):
+        """ start playback if paused """
+        if not self.handler.state.jukebox.playing:
+            self.handler.input('RUMBA.PLAYPAUSE')
+
+    @ravel.method(name='Pause', in_signature='', out_signature='')
+    def pause(self):
+        """ pause playback if playing """
+        if self.handler.state.jukebox.playing:
+            self.handler.input('RUMBA.PLAYPAUSE')
+
+    @ravel.method(name='Stop', in_signature='', out_signature='')
+    def stop(self):
+        """ the jukebox has no stop, pauses """
+        self.pause()
+
+    @ravel.method(name='Seek', in_signature='x', out_signature='', arg_keys=('offset',))
+    def seek(self, offset):
+        """ relative seek, offset in microseconds """
+        self.handler.input('RUMBA.SKIP', max(self.handler.state.jukebox.curPos + offset // 1000000, 0))
+
+    @ravel.method(name='SetPosition', in_signature='ox', out_signature='', arg_keys=('trackId', 'position'))
+    def setPosition(self, trackId, position):
+        """ absolute seek in the current track, position in microseconds """
+        if trackId == self.handler.trackId() and position >= 0:
+            self.handler.input('RUMBA.SKIP', position // 1000000)
+
+    @ravel.method(name='OpenUri', in_signature='s', out_signature='', arg_keys=('uri',))
+    def openUri(self, uri):
+        """ not supported (SupportedUriSchemes) """
+
+    @ravel.propgetter(name='PlaybackStatus', type='s')
+    def playbackStatus(self):
+        """ Playing, Paused or Stopped """
+        return self.handler.props()['PlaybackStatus'][1]
+
+    @ravel.propgetter(name='Metadata', type='a{sv}')
+    def metadata(self):
+        """ metadata of the current song """
+        return self.handler.props()['Metadata'][1]
+
+    @ravel.propgetter(name='Position', type='x',
+                      change_notification=ravel.Introspection.PROP_CHANGE_NOTIFICATION.NONE)
+    def position(self):
+        """ playback position in microseconds, polled by clients """
+        return self.handler.state.jukebox.curPos * 1000000
+
+    @ravel.propgetter(name='Rate', type='d')
+    def rate(self):
+        """ fixed playback rate """
+        return 1.0
+
+    @ravel.propgetter(name='MinimumRate', type='d')
+    def minimumRate(self):
+        """ fixed playback rate """
+        return 1.0
+
+    @ravel.propgetter(name='MaximumRate', type='d')
+    def maximumRate(self):
+        """ fixed playback rate """
+        return 1.0
+
+    @ravel.propgetter(name='Volume', type='d')
+    def volume(self):
+        """ volume is not controlled by the remote """
+        return 1.0
+
+    @ravel.propgetter(name='CanGoNext', type='b')
+    def canGoNext(self):
+        """ next is possible while a song is active """
+        return self.handler.props()['CanGoNext'][1]
+
+    @ravel.propgetter(name='CanGoPrevious', type='b')
+    def canGoPrevious(self):
+        """ previous is possible after the first song """
+        return self.handler.props()['CanGoPrevious'][1]
+
+    @ravel.propgetter(name='CanPlay', type='b')
+    def canPlay(self):
+        """ playback control while a song is active """
+        return self.handler.props()['CanPlay'][1]
+
+    @ravel.propgetter(name='CanPause', type='b')
+    def canPause(self):
+        """ playback control while a song is active """
+        return self.handler.props()['CanPause'][1]
+
+    @ravel.propgetter(name='CanSeek', type='b')
+    def canSeek(self):
+        """ seeking while a song is active """
+        return self.handler.props()['CanSeek'][1]
+
+    @ravel.propgetter(name='CanControl', type='b',
+                      change_notification=ravel.Introspection.PROP_CHANGE_NOTIFICATION.CONST)
+    def canControl(self):
+        """ always controllable """
+        return True
+
+
+class Handler():
+    """
+        Publishes the jukebox as MPRIS media player on D-Bus (org.mpris.MediaPlayer2.rumba),
+        desktop widgets and playerctl get event driven updates (PropertiesChanged, sent
+        only if a property really changed) and control the jukebox without polling the server
+    """
+    def __init__(self, config, controller, loop):
+
+        self.log = logging.getLogger('mpris')
+        self.log.debug('mpris init started')
+
+        self.ctrl = controller
+        self.state = controller.state
+        self.identity = config.get('identity', fallback='rum.ba jukebox')
+        self.published = {}  # last values of all change notified properties
+        self.bus = None
+        try:
+            self.bus = ravel.system_bus() if config.get('bus', fallback='session') == 'system' else ravel.session_bus()
+            self.bus.attach_asyncio(loop)
+            self.bus.register(path=PATH, fallback=False, interface=MediaPlayer2(self))
+            self.bus.register(path=PATH, fallback=False, interface=Player(self))
+            self.bus.request_name(f"{ROOT}.{config.get('name', fallback='rumba')}", ravel.DBUS.NAME_FLAG_DO_NOT_QUEUE)
+            self.published = self.props()
+            self.log.debug('mpris player published')
+        except ravel.dbus.DBusError as de:
+            self.log.error('Publishing mpris player failed: %s', de)
+            self.bus = None
+
+    def input(self, action, val=None):
+        """ control from d-bus clients """
+        self.log.debug('mpris call: %s(%s)', action, val)
+        tracer.begin('input.mpris', action=action)
+        asyncio.ensure_future(self.ctrl.onInput(action, val))
+
+    def trackId(self):
+        """ mpris track id of the current track """
+        return f'/org/rumba/track/{max(self.state.jukebox.curIndex, 0)}'
+
+    def props(self):
+        """ current values of the change notified player properties as (type, value) """
+        jukebox = self.state.jukebox
+        active = self.state.rumbaActive and jukebox.curSong is not None
+        metadata = {}
+        if jukebox.curSong is not None:
+            song = jukebox.curSong
+            metadata = {
+                'mpris:trackid': ('o', self.trackId()),
+                'mpris:length': ('x', int(song.get('duration') or 0) * 1000000),
+                'xesam:title': ('s', str(song.get('title', ''))),
+                'xesam:artist': ('as', [str(song.get('artist', ''))]),
+                'xesam:album': ('s', str(song.get('album', ''))),
+            }
+            if song.get('coverScreenPath'):
+                metadata['mpris:artUrl'] = ('s', f"file://{song['coverScreenPath']}")
+        return {
+            'PlaybackStatus': ('s', 'Playing' if jukebox.playing else ('Paused' if active else 'Stopped')),
+            'Metadata': ('a{sv}', metadata),
+            'CanGoNext': ('b', active and len(jukebox.curSongs) > 0),
+            'CanGoPrevious': ('b', active and jukebox.curIndex > 0),
+            'CanPlay': ('b', active),
+            'CanPause': ('b', active),
+            'CanSeek': ('b', active),
+        }
+
+    @hookimpl
+    def onStateDelta(self, changes, state):
+        """ PropertiesChanged for all properties that really changed (pos changes are not notified),
+            'track' also changes when the metadata of the current song gets hydrated or its cover fetched
+        """
+        if self.bus is not None and changes & {'track', 'play', 'mode'}:
+            for name, (propType, value) in self.props().items():
+                if self.published.get(name) != (propType, value):
+                    self.published[name] = (propType, value)
+                    self.bus.prop_changed(PATH, PLAYER, name, propType, value)
+
+    @hookimpl
+    def onClose(self):
+        """ shutdown, remove player from the bus """
+        if self.bus is not None:
+            self.log.debug('shutdown, unpublishing mpris player')
+            self.bus.unregister(PATH)
@@ -0,0 +1,117 @@
+import logging
+import mmap
+import os
+import struct
+import sys
+import time
+import pluggy
+
+hookimpl = pluggy.HookimplMarker("rumba-remote")
+
+DEFAULT_PATH = '/dev/shm/rumba-remote.state'
+MAGIC = b'RMBA'
+LAYOUT = 1  # incremented on incompatible changes of BODY
+
+# magic, layout, size of body, sequence counter (odd while the snapshot is written)
+HEADER = struct.Struct('<4sHHQ')
+# state version, time written (unix), playing, menu page (-1: hidden), index, pos, duration,
+# mode, power, song id, title, artist, alert (utf-8, zero padded)
+BODY = struct.Struct('<QdBbxxiiI32s8s64s128s128s128s')
+FIELDS = ('version', 'time', 'playing', 'menuPage', 'index', 'pos', 'duration',
+          'mode', 'power', 'songId', 'title', 'artist', 'alert')
+SIZE = HEADER.size + BODY.size
+
+
+def readSnapshot(path=DEFAULT_PATH, retries=100):
+    """ Reads the current state snapshot (for other processes),
+        returns a dict (see FIELDS) or None if not available.
+        Seqlock: retried if the snapshot got changed while reading
+    """
+    try:
+        with open(path, 'rb') as snapshotFile:
+            with mmap.mmap(snapshotFile.fileno(), SIZE, access=mmap.ACCESS_READ) as mm:
+                for _ in range(retries):
+                    magic, layout, size, seq = HEADER.unpack_from(mm, 0)
+                    if magic != MAGIC or layout != LAYOUT or size != BODY.size:
+                        return None
+                    if seq % 2:  # write in progress
+                        time.sleep(0)
+                        continue
+                    values = BODY.unpack_from(mm, HEADER.size)
+                    if HEADER.unpack_from(mm, 0)[3] == seq:
+                        snapshot = dict(zip(FIELDS, values))
+                        for key in ('mode', 'power', 'songId', 'title', 'artist', 'alert'):
+                            snapshot[key] = snapshot[key].rstrip(b'\0').decode('utf-8', errors='ignore')
+                        snapshot['playing'] = bool(snapshot['playing'])
+                        snapshot['menuPage'] = snapshot['menuPage'] if snapshot['menuPage'] >= 0 else None
+                        return snapshot
+    except (OSError, ValueError):
+        pass
+    return None
+
+
+class Handler():
+    """
+        Publishes a compact snapshot of the state into a memory mapped file
+        (eg in /dev/shm) on every state change: status bars, a second display,
+        monitoring scripts.. get the current state without polling the jukebox
+        or the remote. Versioned with a seqlock style counter, see readSnapshot()
+        or run 'python3 shm.py [path]' to print the snapshot
+    """
+    def __init__(self, config, controller, loop):
+
+        self.log = logging.getLogger('shm')
+        self.log.debug('shm init started')
+
+        self.path = config.get('path', fallback=DEFAULT_PATH)
+        self.seq = 0
+        self.mm = None
+        try:
+            fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+            try:
+                os.ftruncate(fd, SIZE)
+                self.mm = mmap.mmap(fd, SIZE)
+            finally:
+                os.close(fd)
+            HEADER.pack_into(self.mm, 0, MAGIC, LAYOUT, BODY.size, self.seq)
+            self.publish(controller.state)
+            self.log.debug('publishing state in %s', self.path)
+        except OSError as oe:
+            self.log.error('Creating state snapshot %s failed: %s', self.path, oe)
+
+    def publish(self, state):
+        """ writes the snapshot, readers retry while the counter is odd or changed """
+        curSong = state.jukebox.curSong or {}
+        values = (
+            state.version, time.time(), state.jukebox.playing,
+            state.menuPage if state.menuPage is not None else -1,
+            state.jukebox.curIndex, state.jukebox.curPos, curSong.get('duration') or 0,
+            (state.activeModule.name if state.activeModule is not None else '').encode(),
+            state.power.encode(), str(curSong.get('id', '')).encode(),
+            curSong.get('title', '').encode(), curSong.get('artist', '').encode(), (state.alert or '').encode())
+        self.seq += 1
+        HEADER.pack_into(self.mm, 0, MAGIC, LAYOUT, BODY.size, self.seq)
+        BODY.pack_into(self.mm, HEADER.size, *values)
+        self.seq += 1
+        HEADER.pack_into(self.mm, 0, MAGIC, LAYOUT, BODY.size, self.seq)
+
+    @hookimpl
+    def onStateDelta(self, changes, state):
+        """ new snapshot on every state change """
+        if self.mm is not None:
+            self.publish(state)
+
+    @hookimpl
+    def onClose(self):
+        """ shutdown, readers get None after the snapshot is removed """
+        self.log.debug('shutdown, removing state snapshot')
+        if self.mm is not None:
+            self.mm.close()
+            try:
+                os.unlink(self.path)
+            except OSError:
+                pass
+
+
+if __name__ == '__main__':
+    print(readSnapshot(*sys.argv[1:2]))
@@ -0,0 +1,125 @@
+import asyncio
+import json
+import logging
+import os
+import pluggy
+from monitor import tracer
+
+hookimpl = pluggy.HookimplMarker("rumba-remote")
+
+
+class Handler():
+    """
+        Local control via a unix domain socket (newline delimited json)
+        for scripts, kanshi hooks, test harnesses.. without touching the filesystem,
+        eg: echo '{"cmd": "input", "action": "RUMBA.NEXT"}' | socat - UNIX-CONNECT:$SOCKET
+
+        commands (an optional "id" is passed back with the response):
+        {"cmd": "input", "action": "RUMBA.SKIP", "val": 30}  any onInput action with optional value
+        {"cmd": "state"}  current state
+        {"cmd": "metrics"}  runtime metrics (hook timing, loop lag, timers, input queue..)
+        {"cmd": "subscribe"}  streams {"event": "delta", ..} with the changed fields and state on every change
+        responses: {"ok": true, ..} or {"ok": false, "error": ".."}
+    """
+    def __init__(self, config, controller, loop):
+
+        self.log = logging.getLogger('socket')
+        self.log.debug('socket init started')
+
+        self.ctrl = controller
+        self.path = config.get('path', fallback=os.path.join(controller.configDir, 'control.sock'))
+        self.maxBuffer = config.getint('maxBuffer', fallback=65536)  # bytes, slower subscribers get disconnected
+        self.subscribers = set()  # stream writers of subscribed clients
+        self.clients = set()  # tasks of connected clients
+        self.server = None
+        self.startTask = asyncio.ensure_future(self._start())
+
+    async def _start(self):
+        """ start listening, a stale socket file of a previous run gets replaced """
+        try:
+            if os.path.exists(self.path):
+                os.unlink(self.path)
+            self.server = await asyncio.start_unix_server(self._handleClient, path=self.path)
+            os.chmod(self.path, 0o660)
+            self.log.info('listening on %s', self.path)
+        except OSError as oe:
+            self.log.error('Opening socket %s failed: %s', self.path, oe)
+
+    async def _handleClient(self, reader, writer):
+        """ handles the commands of one client, one json object per line """
+        self.clients.add(asyncio.current_task())
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                try:
+                    request = json.loads(line)
+                    response = await self._handleCommand(request, writer)
+                except (ValueError, TypeError, AttributeError) as e:
+                    request, response = {}, {'ok': False, 'error': f'invalid request: {e}'}
+                if isinstance(request, dict) and 'id' in request:
+                    response['id'] = request['id']
+                self._send(writer, response)
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError, asyncio.LimitOverrunError) as e:
+            self.log.debug('client disconnected: %s', e)
+        except asyncio.CancelledError:
+            pass
+        finally:
+            self.subscribers.discard(writer)
+            self.clients.discard(asyncio.current_task())
+            writer.close()
+
+    async def _handleCommand(self, request, writer):
+        """ returns response to a single command """
+        cmd = request.get('cmd')
+        if cmd == 'input':
+            action = request.get('action')
+            if not isinstance(action, str) or not self.ctrl.isValidAction(action):
+                return {'ok': False, 'error': f'invalid action: {action}'}
+            tracer.begin('input.socket', action=action)
+            await self.ctrl.onInput(action, request.get('val'))
+            return {'ok': True}
+        if cmd == 'state':
+            return {'ok': True, 'state': self.ctrl.state.export()}
+        if cmd == 'metrics':
+            return {'ok': True, 'metrics': self.ctrl.getMetrics()}
+        if cmd == 'subscribe':
+            self.subscribers.add(writer)
+            return {'ok': True, 'state': self.ctrl.state.export()}
+        if cmd == 'unsubscribe':
+            self.subscribers.discard(writer)
+            return {'ok': True}
+        return {'ok': False, 'error': f'unknown command: {cmd}'}
+
+    def _send(self, writer, message):
+        """ writes one json line (buffered by the transport) """
+        writer.write(json.dumps(message, default=str).encode() + b'\n')
+
+    @hookimpl
+    def onStateDelta(self, changes, state):
+        """ stream changes to subscribers, clients not reading their stream get dropped """
+        if self.subscribers:
+            message = {'event': 'delta', 'changes': sorted(changes), 'state': state.export()}
+            for writer in list(self.subscribers):
+                if writer.transport.get_write_buffer_size() > self.maxBuffer:
+                    self.log.warning('dropping slow subscriber')
+                    self.subscribers.discard(writer)
+                    writer.close()
+                else:
+                    self._send(writer, message)
+
+    @hookimpl
+    def onClose(self):
+        """ shutdown, close socket and client connections """
+        self.log.debug('shutdown, closing socket')
+        self.startTask.cancel()
+        for client in list(self.clients):
+            client.cancel()
+        if self.server is not None:
+            self.server.close()
+            try:
+                os.unlink(self.path)
+            except OSError:
+                pass
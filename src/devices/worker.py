@@ -0,0 +1,72 @@
+import logging
+import threading
+from collections import OrderedDict
+
+FULL = 'full'  # key for full redraws, supersedes all pending partial updates
+
+
+def createWorker(plugin, config, name):
+    """ RenderWorker for a device plugin that declares itself threaded: class attribute THREADED,
+        'threaded' in the device config overrides it. Returns None if the plugin renders on the loop
+    """
+    if config.getboolean('threaded', fallback=getattr(plugin, 'THREADED', False)):
+        logging.getLogger(name).debug('Rendering in worker thread')
+        return RenderWorker(name)
+    return None
+
+
+class RenderWorker():
+    """ Runs the (blocking) rendering of an output plugin in its own thread,
+        so slow output like a full display redraw does not delay input handling
+        on the event loop. Used by every device plugin that declares
+        itself threaded (see createWorker)
+
+        Works as a latest-state mailbox: every kind of update (full redraw,
+        position, menu..) has a key and only the latest pending update per key
+        gets rendered, a full redraw drops all pending partial updates.
+        Outdated renders are skipped instead of queued up.
+        All arguments need to be copies, the caller keeps changing its state
+    """
+    def __init__(self, name):
+        self.log = logging.getLogger(name)
+        self.pending = OrderedDict()  # key -> (func, args), rendered in order of submission
+        self.cond = threading.Condition()
+        self.running = True
+        self.skipped = 0  # outdated renders dropped
+        self.thread = threading.Thread(target=self._run, name=name, daemon=True)
+        self.thread.start()
+
+    def submit(self, key, func, *args):
+        """ schedule func(*args), replaces a pending update with the same key """
+        with self.cond:
+            if key == FULL:
+                self.skipped += len(self.pending)
+                self.pending.clear()
+            elif key in self.pending:
+                self.skipped += 1
+                del self.pending[key]  # re-add at the end to keep order of updates
+            self.pending[key] = (func, args)
+            self.cond.notify()
+
+    def _run(self):
+        """ worker thread: render pending updates until closed """
+        while True:
+            with self.cond:
+                while self.running and not self.pending:
+                    self.cond.wait()
+                if not self.running:
+                    return
+                _, (func, args) = self.pending.popitem(last=False)
+            try:
+                func(*args)
+            except Exception:  # pylint: disable=broad-except
+                self.log.exception('render failed: %s', getattr(func, '__name__', func))
+
+    def close(self, timeout=1):
+        """ stop worker thread, pending updates are dropped """
+        with self.cond:
+            self.running = False
+            self.pending.clear()
+            self.cond.notify()
+        self.thread.join(timeout)
+        self.log.debug('render worker stopped (%s outdated renders skipped)', self.skipped)
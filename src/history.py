@@ -0,0 +1,123 @@
+#!/usr/bin/python3
+import logging
+import os
+import struct
+import sys
+import time
+from collections import defaultdict
+
+# fixed size record: start time (unix seconds), song id, seconds played
+RECORD = struct.Struct('<IIH')
+
+MAX_GAP = 10  # seconds counted at most between two updates (longer gaps: connection lost, remote suspended..)
+RESTART = 5  # a track jumping back to a position below this is played again (eg same id twice in a row)
+
+
+class HistoryRecorder():
+    """ Local play history: every played track gets appended as one fixed size
+        binary record to a daily file (history-YYYYMMDD.bin), so writing is
+        a single O(1) append without rewriting anything. Files older than
+        keepDays are removed when a new day starts.
+
+        Gets updated by the jukebox connector after every status change,
+        seconds played are accumulated while the jukebox is playing.
+        Use readHistory()/aggregateHistory() for offline stats or scrobbling
+    """
+    def __init__(self, historyDir, keepDays=30):
+        self.log = logging.getLogger('hist')
+        self.historyDir = historyDir
+        self.keepDays = keepDays
+        os.makedirs(historyDir, exist_ok=True)
+        self.file = None
+        self.fileDay = None
+        self.songId = None  # currently played track
+        self.started = 0  # unix time the track started
+        self.played = 0.0  # seconds played so far
+        self.lastUpdate = None  # monotonic time of last update while playing
+        self.lastPos = 0  # playback position of the last update
+
+    def update(self, songId, playing, pos=0):
+        """ records the previous track when the track changes or the same track starts again """
+        now = time.monotonic()
+        if self.lastUpdate is not None:
+            self.played += min(now - self.lastUpdate, MAX_GAP)
+        self.lastUpdate = now if playing else None
+        if songId != self.songId or pos < min(self.lastPos, RESTART):
+            self._record()
+            self.songId = songId
+            self.started = time.time()
+            self.played = 0.0
+        self.lastPos = pos
+
+    def pause(self):
+        """ no playback until the next update (connection lost, jukebox stopped for another mode) """
+        self.lastUpdate = None
+
+    def _record(self):
+        """ appends record of current track if it has been played at all """
+        if self.songId is None or self.played < 1:
+            return
+        try:
+            record = RECORD.pack(int(self.started), int(self.songId), min(int(self.played), 0xFFFF))
+        except (ValueError, struct.error):
+            self.log.warning('Not recording song id %s, needs to be numeric', self.songId)
+            return
+        try:
+            day = time.strftime('%Y%m%d')
+            if day != self.fileDay:
+                self._rotate(day)
+            self.file.write(record)
+            self.file.flush()
+        except OSError as oe:
+            self.log.warning('Writing play history failed: %s', oe)
+
+    def _rotate(self, day):
+        """ starts a new daily file and removes outdated ones """
+        if self.file is not None:
+            self.file.close()
+        # kept open for appending, closed on rotation or shutdown
+        self.file = open(os.path.join(self.historyDir, f'history-{day}.bin'), 'ab')  # pylint: disable=R1732
+        self.fileDay = day
+        if self.keepDays > 0:
+            oldest = time.strftime('%Y%m%d', time.localtime(time.time() - self.keepDays * 86400))
+            for fileName in os.listdir(self.historyDir):
+                if fileName.startswith('history-') and fileName.endswith('.bin') and fileName[8:16] < oldest:
+                    self.log.debug('Removing outdated history file %s', fileName)
+                    os.remove(os.path.join(self.historyDir, fileName))
+
+    def close(self):
+        """ records the running track and closes the history file """
+        self.update(None, False)
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+
+def readHistory(path, chunkRecords=4096):
+    """ Streams (timestamp, songId, secondsPlayed) tuples from a history file,
+        reads large chunks at once and ignores a truncated last record
+    """
+    with open(path, 'rb') as file:
+        while True:
+            chunk = file.read(RECORD.size * chunkRecords)
+            if not chunk:
+                break
+            yield from RECORD.iter_unpack(chunk[:len(chunk) - (len(chunk) % RECORD.size)])
+
+
+def aggregateHistory(paths):
+    """ Number of plays and seconds played per song id over one or many history files """
+    stats = defaultdict(lambda: [0, 0])
+    for path in paths:
+        for _, songId, played in readHistory(path):
+            stats[songId][0] += 1
+            stats[songId][1] += played
+    return dict(stats)
+
+
+if __name__ == "__main__":
+    # print most played songs, eg: history.py ~/.config/rumba-remote/history/history-2023*.bin
+    if len(sys.argv) < 2:
+        sys.exit(f'usage: {sys.argv[0]} HISTORYFILE [HISTORYFILE ..]')
+    for topId, (plays, seconds) in sorted(aggregateHistory(sys.argv[1:]).items(), key=lambda s: -s[1][0])[:50]:
+        print(f'{topId:>10}  {plays:>5} plays  {seconds // 60:>6} min')
@@ -0,0 +1,81 @@
+import asyncio
+import itertools
+import logging
+import time
+
+# lower value gets handled first
+PRIORITY_CONFIRM = 0  # second click of a confirmation ('doubleclick')
+PRIORITY_KEY = 1  # key injection, eg for emulators
+PRIORITY_DEFAULT = 2
+
+# merge rules for actions that are still waiting to be handled
+TOGGLES = ('RUMBA.PLAYPAUSE',)  # pressed twice cancels out
+LATEST = ('RUMBA.SKIP', 'RUMBA.VIDEO')  # only the latest value counts
+
+
+class InputQueue():
+    """ Scheduler for user input: actions that can't be handled right away
+        (eg while a request to the jukebox is running) are queued instead
+        of getting dropped and are handled one after the other.
+
+        Actions are ordered by priority and time of input, merged if
+        possible (play/pause twice, skip to the latest position..),
+        the queue depth is bounded and actions waiting longer than
+        maxAge seconds expire, so the latency of every press is bounded
+    """
+    def __init__(self, maxDepth=8, maxAge=5.0):
+        self.log = logging.getLogger('input')
+        self.maxDepth = maxDepth
+        self.maxAge = maxAge
+        self.entries = []  # [priority, seqNo, time, action, val, traceId]
+        self.seqNo = itertools.count()
+        self.available = asyncio.Event()
+        self.dropped = 0  # actions expired or dropped because queue was full
+
+    def __len__(self):
+        return len(self.entries)
+
+    def put(self, action, val=None, priority=PRIORITY_DEFAULT, traceId=None):
+        """ queue action or merge it with a pending one, traceId is passed on to the consumer (see monitor.Tracer) """
+        pending = next((entry for entry in self.entries if entry[3] == action), None)
+        if pending is not None:
+            if action in TOGGLES:
+                self.log.debug('%s cancels pending %s', action, action)
+                self.entries.remove(pending)
+                return
+            if action in LATEST:
+                self.log.debug('%s(%s) replaces pending value %s', action, val, pending[4])
+                pending[4] = val
+                return
+        if len(self.entries) >= self.maxDepth:
+            # drop the oldest entry of the lowest priority
+            drop = max(self.entries, key=lambda entry: (entry[0], -entry[1]))
+            self.log.warning('input queue full, dropping %s', drop[3])
+            self.entries.remove(drop)
+            self.dropped += 1
+        self.entries.append([priority, next(self.seqNo), time.monotonic(), action, val, traceId])
+        self.available.set()
+
+    async def get(self):
+        """ waits for the next action that has not expired, returns (action, val, traceId) """
+        while True:
+            self._expire()
+            if self.entries:
+                entry = min(self.entries, key=lambda entry: (entry[0], entry[1]))
+                self.entries.remove(entry)
+                return entry[3], entry[4], entry[5]
+            self.available.clear()
+            await self.available.wait()
+
+    def _expire(self):
+        """ removes actions waiting longer than maxAge """
+        if self.maxAge > 0:
+            oldest = time.monotonic() - self.maxAge
+            for entry in [entry for entry in self.entries if entry[2] < oldest]:
+                self.log.info('input expired: %s(%s)', entry[3], entry[4])
+                self.entries.remove(entry)
+                self.dropped += 1
+
+    def clear(self):
+        """ drop all pending actions """
+        self.entries.clear()
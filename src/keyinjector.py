@@ -0,0 +1,154 @@
+import asyncio
+import logging
+from collections import namedtuple
+from functools import lru_cache
+import evdev
+
+# modifier: pause after pressing modifier keys before the other keys of a chord
+# hold: time the keys of a chord are held down
+# release: pause after releasing a chord (before the next one of a sequence)
+Timing = namedtuple('Timing', ['modifier', 'hold', 'release'])
+
+PROFILES = {
+    # slow but known to work with everything tested so far (X11, wayland, emulationstation)
+    'safe': Timing(0.2, 0.5, 0.4),
+    # mame polls input once per frame: a key has to be held for at least 2 frames
+    'mame': Timing(0, 0.05, 0.03),
+    # vice scans the c64 keyboard matrix with 50/60Hz, modifiers need to be seen first
+    'vice': Timing(0.04, 0.08, 0.06),
+}
+
+SETTLE = 0.5  # seconds a newly created device needs until compositors/apps receive its events
+BATCH = 1.0  # seconds late registrations (eg addons) are collected before the device gets extended
+
+MODIFIERS = ('LEFTCTRL', 'RIGHTCTRL', 'LEFTSHIFT', 'RIGHTSHIFT', 'LEFTALT', 'RIGHTALT', 'LEFTMETA', 'RIGHTMETA')
+
+
+@lru_cache(maxsize=128)
+def parseMacro(macro):
+    """ Parses key macros to a tuple of chords:
+        keys of a chord are joined by '+' and pressed at once (modifiers first),
+        chords of a sequence are separated by '>' eg 'LEFTALT+F10>RETURN'
+        an abbreviation for the menu icon gets removed (eg LEFTCTRL+C.CPY)
+        Returns ((modifier codes), (key codes)) per chord, raises ValueError for unknown keys
+    """
+    chords = []
+    for chord in macro.split('.')[0].split('>'):
+        names = [name.strip().upper() for name in chord.split('+') if name.strip()]
+        try:
+            codes = [getattr(evdev.ecodes, f'KEY_{name}') for name in names]
+        except AttributeError as ae:
+            raise ValueError(f'Unknown key in macro {macro}') from ae
+        chords.append((
+            tuple(code for name, code in zip(names, codes) if name in MODIFIERS),
+            tuple(code for name, code in zip(names, codes) if name not in MODIFIERS)))
+    return tuple(chords)
+
+
+class KeyInjector():
+    """ Injects key macros (single keys, chords and sequences of chords)
+        via a virtual uinput keyboard, see InputHandler.initKeyboard()
+
+        The virtual keyboard is created lazily and only supports the keys
+        that are actually used: keys referenced in the config/addon menus get
+        registered and the device is created in the background (prewarm),
+        unregistered keys (re-)create the device on first use. Late registrations
+        are batched and the device is only replaced while no key is pressed.
+
+        Timing depends on the receiving application, every addon can
+        select a timing profile (see BaseAddon.KEY_TIMING). All events of a step
+        (eg modifiers and key down) are written as one batch with a single syn()
+    """
+    def __init__(self, name):
+        self.log = logging.getLogger('keys')
+        self.name = name
+        self.uinput = None  # virtual keyboard
+        self.keys = frozenset()  # key codes supported by the current device
+        self.wanted = set()  # key codes registered for injection
+        self.creating = None  # background task creating the device
+        self.started = False  # background creation enabled (needs running event loop)
+        self.batchHandle = None  # pending prewarm of late registrations
+        self.idle = asyncio.Event()  # set while no macro is being injected
+        self.idle.set()
+
+    def register(self, macros):
+        """ registers the keys of macros that will be injected """
+        for macro in macros:
+            try:
+                for modifiers, keys in parseMacro(macro):
+                    self.wanted.update(modifiers + keys)
+            except ValueError as ve:
+                self.log.error('Config error: %s', ve)
+        if self.started and not self.wanted <= self.keys and self.batchHandle is None:
+            self.batchHandle = asyncio.get_event_loop().call_later(BATCH, self.prewarm)
+
+    def prewarm(self):
+        """ creates the virtual keyboard for all registered keys in the background """
+        self.started = True
+        if self.batchHandle is not None:
+            self.batchHandle.cancel()
+            self.batchHandle = None
+        if not self.wanted <= self.keys and (self.creating is None or self.creating.done()):
+            self.creating = asyncio.ensure_future(self._create())
+
+    async def _create(self):
+        """ (re-)creates the device in an executor (registering with the kernel takes a while) """
+        while not self.wanted <= self.keys:
+            keys = frozenset(self.wanted | self.keys)
+            self.log.debug('Creating virtual keyboard with %s keys', len(keys))
+            try:
+                uinput = await asyncio.get_event_loop().run_in_executor(
+                    None, lambda: evdev.UInput({evdev.ecodes.EV_KEY: sorted(keys)}, name=self.name, version=0x3))
+            except (OSError, evdev.UInputError) as e:
+                self.log.error('Creating virtual keyboard failed: %s', e)
+                return
+            await self.idle.wait()  # never replace the device in the middle of a macro
+            if self.uinput is not None:
+                self.uinput.close()
+            self.uinput, self.keys = uinput, keys
+
+    def _write(self, codes, value):
+        """ one batch of key events """
+        for code in codes:
+            self.uinput.write(evdev.ecodes.EV_KEY, code, value)
+        self.uinput.syn()
+
+    async def press(self, macro, profile='safe'):
+        """ inject macro with timing profile (name of a profile or a Timing tuple) """
+        timing = PROFILES.get(profile, PROFILES['safe']) if isinstance(profile, str) else profile
+        chords = parseMacro(macro)
+        codes = {code for modifiers, keys in chords for code in modifiers + keys}
+        if self.creating is not None and not self.creating.done():
+            await self.creating
+        if not codes <= self.keys:  # not registered: create device now
+            self.wanted.update(codes)
+            self.prewarm()
+            await self.creating
+            if not codes <= self.keys:
+                raise OSError('Virtual keyboard not available')
+            await asyncio.sleep(SETTLE)
+        self.log.debug('Injecting %s (%s)', macro, profile)
+        self.idle.clear()
+        try:
+            for modifiers, keys in chords:
+                if modifiers and timing.modifier > 0:
+                    self._write(modifiers, 1)
+                    await asyncio.sleep(timing.modifier)
+                    self._write(keys, 1)
+                else:
+                    self._write(modifiers + keys, 1)
+                await asyncio.sleep(timing.hold)
+                self._write(reversed(modifiers + keys), 0)
+                if timing.release > 0:
+                    await asyncio.sleep(timing.release)
+        finally:
+            self.idle.set()
+
+    def close(self):
+        """ release virtual keyboard """
+        if self.batchHandle is not None:
+            self.batchHandle.cancel()
+        if self.creating is not None:
+            self.creating.cancel()
+        if self.uinput is not None:
+            self.uinput.close()
@@ -0,0 +1,259 @@
+import contextvars
+import itertools
+import json
+import logging
+import os
+import sys
+import threading
+import time
+import traceback
+from collections import deque
+from contextlib import contextmanager, nullcontext
+from functools import wraps
+
+
+class HookStarts(threading.local):
+    """ start times of running (possibly nested) hook calls, kept per thread:
+        hooks can also be called from other threads (eg a render worker)
+    """
+    def __init__(self):
+        super().__init__()
+        self.stack = []
+
+
+class HookMonitor():
+    """ Timing of all plugin hooks: all output plugins run synchronously
+        on the event loop, a slow plugin (eg a display doing a full redraw)
+        delays the handling of user input for everything else.
+
+        Uses pluggy's hookcall monitoring to time every hook call and wraps
+        the hook implementations (lazily on their first call) to time every
+        plugin separately. Calls slower than threshold get logged,
+        the durations of the last calls are kept for getStats()
+    """
+    def __init__(self, pluginManager, threshold=0.05, window=100):
+        self.log = logging.getLogger('monitor')
+        self.threshold = threshold  # seconds
+        self.window = window  # number of calls kept per plugin and hook
+        self.durations = {}  # (plugin, hook) -> durations of last calls, plugin '*' for the whole hook call
+        self.started = HookStarts()
+        self.originals = {}  # wrapped hook implementations -> original function, restored on close()
+        self.undo = pluginManager.add_hookcall_monitoring(self._before, self._after)
+
+    def _before(self, hookName, hookImpls, kwargs):
+        """ pluggy monitoring: hook call starts """
+        for impl in hookImpls:
+            if impl not in self.originals and not (impl.wrapper or impl.hookwrapper):
+                self.originals[impl] = impl.function
+                impl.function = self._wrap(impl.function, impl.plugin_name, hookName)
+        self.started.stack.append(time.perf_counter())
+
+    def _after(self, outcome, hookName, hookImpls, kwargs):
+        """ pluggy monitoring: hook call done """
+        self._add('*', hookName, time.perf_counter() - self.started.stack.pop())
+
+    def _wrap(self, func, pluginName, hookName):
+        """ time a single hook implementation """
+        @wraps(func)
+        def timed(*args):
+            start = time.perf_counter()
+            try:
+                return func(*args)
+            finally:
+                self._add(pluginName, hookName, time.perf_counter() - start)
+        return timed
+
+    def _add(self, pluginName, hookName, duration):
+        key = (pluginName, hookName)
+        if key not in self.durations:
+            self.durations[key] = deque(maxlen=self.window)
+        self.durations[key].append(duration)
+        if duration > self.threshold and pluginName != '*':
+            self.log.warning('slow hook: %s in %s took %.1f ms', hookName, pluginName, duration * 1000)
+
+    def getStats(self):
+        """ rolling stats (milliseconds) per plugin and hook, slowest first """
+        stats = {}
+        for (pluginName, hookName), durations in self.durations.items():
+            ordered = sorted(durations)
+            stats[f'{pluginName}.{hookName}'] = {
+                'calls': len(ordered),
+                'avg': sum(ordered) / len(ordered) * 1000,
+                'p95': ordered[int((len(ordered) - 1) * 0.95)] * 1000,
+                'max': ordered[-1] * 1000,
+            }
+        return dict(sorted(stats.items(), key=lambda s: -s[1]['max']))
+
+    def close(self):
+        """ remove monitoring from plugin manager, hook implementations get their original functions back """
+        self.undo()
+        for impl, function in self.originals.items():
+            impl.function = function
+        self.originals.clear()
+
+
+class LoopMonitor():
+    """ Measures the scheduling delay of the event loop: a heartbeat callback
+        is scheduled every interval seconds and the delay of every beat is kept
+        for percentiles (getStats). A watchdog thread logs the stack of the
+        event loop thread if a beat is late for more than threshold seconds,
+        ie a callback is blocking the loop (and freezes ui and input handling)
+    """
+    def __init__(self, threshold=0.1, interval=0.25, window=1000):
+        self.log = logging.getLogger('monitor')
+        self.threshold = threshold  # seconds
+        self.interval = interval  # seconds between heartbeats
+        self.lags = deque(maxlen=window)  # scheduling delays of the last beats
+        self.blocked = 0  # number of blocking callbacks found
+        self.loop = None
+        self.loopThread = None  # thread id of the event loop
+        self.handle = None  # next heartbeat
+        self.expected = 0.0  # time the next heartbeat is due
+        self.reported = False  # stack of the current block already logged
+        self.stopped = threading.Event()
+        self.watchdog = threading.Thread(target=self._watch, name='loopmonitor', daemon=True)
+
+    def start(self, loop):
+        """ starts heartbeat and watchdog, has to be called from the event loop thread """
+        self.loop = loop
+        self.loopThread = threading.get_ident()
+        self.expected = time.monotonic() + self.interval
+        self.handle = loop.call_later(self.interval, self._beat)
+        self.watchdog.start()
+
+    def _beat(self):
+        """ heartbeat on the event loop """
+        now = time.monotonic()
+        lag = max(now - self.expected, 0.0)
+        self.lags.append(lag)
+        if self.reported:
+            self.log.warning('event loop was blocked for %.0f ms', lag * 1000)
+            self.reported = False
+        self.expected = now + self.interval
+        self.handle = self.loop.call_later(self.interval, self._beat)
+
+    def _watch(self):
+        """ watchdog thread: logs the stack of the loop thread while a beat is overdue """
+        while not self.stopped.wait(self.threshold / 2):
+            if not self.reported and time.monotonic() - self.expected > self.threshold:
+                frame = sys._current_frames().get(self.loopThread)  # pylint: disable=protected-access
+                if frame is not None:
+                    self.reported = True
+                    self.blocked += 1
+                    self.log.warning('event loop blocked for more than %.0f ms:\n%s',
+                                     self.threshold * 1000, ''.join(traceback.format_stack(frame)))
+
+    def getStats(self):
+        """ scheduling delay percentiles (milliseconds) """
+        if not self.lags:
+            return {}
+        ordered = sorted(self.lags)
+        return {
+            'beats': len(ordered),
+            'p50': ordered[int((len(ordered) - 1) * 0.5)] * 1000,
+            'p95': ordered[int((len(ordered) - 1) * 0.95)] * 1000,
+            'p99': ordered[int((len(ordered) - 1) * 0.99)] * 1000,
+            'max': ordered[-1] * 1000,
+            'blocked': self.blocked,
+        }
+
+    def close(self):
+        """ stop heartbeat and watchdog """
+        self.stopped.set()
+        if self.handle is not None:
+            self.handle.cancel()
+
+
+class Tracer():
+    """ Span based tracing from user input to the display: every input gets
+        a trace id (begin) that follows it via contextvars through onInput,
+        the queued action, jukebox requests, hook calls and the rendering
+        (also in the render thread, see wrap). All spans are exported as
+        chrome trace events (open in chrome://tracing or perfetto),
+        the trace id is passed in the args of every span.
+        Disabled until start() is called, spans are no-ops then
+    """
+    def __init__(self, maxEvents=100000):
+        self.log = logging.getLogger('monitor')
+        self.enabled = False
+        self.events = deque(maxlen=maxEvents)
+        self.ids = itertools.count(1)
+        self.traceId = contextvars.ContextVar('traceId', default=None)
+        self.pid = os.getpid()
+        self.hooksStarted = HookStarts()
+        self.undo = None  # removes hook monitoring
+
+    def start(self, pluginManager=None):
+        """ enable tracing, all hook calls of pluginManager get traced too """
+        self.enabled = True
+        if pluginManager is not None:
+            self.undo = pluginManager.add_hookcall_monitoring(self._beforeHook, self._afterHook)
+
+    def begin(self, name, **args):
+        """ new trace for a user input, returns the trace id """
+        if not self.enabled:
+            return None
+        traceId = next(self.ids)
+        self.traceId.set(traceId)
+        self.events.append({'name': name, 'ph': 'i', 's': 't', 'ts': time.perf_counter() * 1e6, 'pid': self.pid,
+                            'tid': threading.get_ident(), 'args': {'traceId': traceId, **args}})
+        return traceId
+
+    def current(self):
+        """ trace id of the current context """
+        return self.traceId.get()
+
+    def resume(self, traceId):
+        """ continue a trace in the current context (eg after passing a queue) """
+        self.traceId.set(traceId)
+
+    def span(self, name, **args):
+        """ context manager timing a span of the current trace """
+        if not self.enabled:
+            return nullcontext()
+        return self._span(name, self.traceId.get(), args)
+
+    @contextmanager
+    def _span(self, name, traceId, args):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self._add(name, start, time.perf_counter(), traceId, args)
+
+    def wrap(self, func, name):
+        """ func as span of the current trace, eg to be called in another thread """
+        if not self.enabled:
+            return func
+        traceId = self.traceId.get()
+
+        @wraps(func)
+        def traced(*args):
+            with self._span(name, traceId, {}):
+                return func(*args)
+        return traced
+
+    def _beforeHook(self, hookName, hookImpls, kwargs):
+        self.hooksStarted.stack.append(time.perf_counter())
+
+    def _afterHook(self, outcome, hookName, hookImpls, kwargs):
+        self._add(f'hook.{hookName}', self.hooksStarted.stack.pop(), time.perf_counter(), self.traceId.get(), {})
+
+    def _add(self, name, start, end, traceId, args):
+        self.events.append({'name': name, 'ph': 'X', 'ts': start * 1e6, 'dur': (end - start) * 1e6, 'pid': self.pid,
+                            'tid': threading.get_ident(), 'args': {'traceId': traceId, **args}})
+
+    def export(self, path):
+        """ write all recorded events as chrome trace event json """
+        with open(path, 'w', encoding='utf-8') as traceFile:
+            json.dump({'traceEvents': list(self.events), 'displayTimeUnit': 'ms'}, traceFile, default=str)
+        self.log.info('%s trace events written to %s', len(self.events), path)
+
+    def close(self):
+        """ stop tracing """
+        self.enabled = False
+        if self.undo is not None:
+            self.undo()
+
+
+tracer = Tracer()  # shared by controller, jukebox connector and devices
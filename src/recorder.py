@@ -0,0 +1,48 @@
+import json
+import logging
+import time
+
+
+class InputRecorder():
+    """ Records all user input (seconds since start, action, value) as json lines,
+        eg to replay real sessions for load tests with sys/inputReplay.py
+    """
+    def __init__(self, path):
+        self.log = logging.getLogger('input')
+        self.started = time.monotonic()
+        # line buffered: one write per input, kept open while recording and closed by the controller's onClose
+        self.file = open(path, 'a', buffering=1, encoding='utf-8')  # pylint: disable=R1732
+        self.log.info('Recording input to %s', path)
+
+    def record(self, action, val=None):
+        """ append one input """
+        try:
+            self.file.write(json.dumps({'t': round(time.monotonic() - self.started, 4), 'action': action, 'val': val},
+                                       default=str) + '\n')
+        except (OSError, ValueError) as e:
+            self.log.warning('Recording input failed: %s', e)
+
+    def close(self):
+        """ stop recording """
+        self.file.close()
+
+
+def readRecording(path):
+    """ Recorded input as list of (seconds, action, value), recordings
+        appended by several sessions get played one after the other
+    """
+    inputs = []
+    offset = last = 0.0
+    with open(path, 'r', encoding='utf-8') as recording:
+        for line in recording:
+            try:
+                entry = json.loads(line)
+                t = float(entry['t'])
+                action = entry['action']
+            except (ValueError, KeyError, TypeError):
+                continue
+            if t + offset < last:  # next session
+                offset = last
+            last = t + offset
+            inputs.append((last, action, entry.get('val')))
+    return inputs
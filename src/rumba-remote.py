@@ -19,6 +19,7 @@ if __name__ == "__main__":
     # get settings
     parser = argparse.ArgumentParser()
     parser.add_argument("-c", "--configFile", help="Path to the config file")
+    parser.add_argument("-u", "--uvloop", action="store_true", help="Use uvloop as event loop (if installed)")
     args = parser.parse_args()
 
     # config currently only features things I needed so far to configure my own collection of devices,
@@ -29,6 +30,13 @@ if __name__ == "__main__":
         sys.exit(ce)
 
     # setup loop & controller
+    if args.uvloop:
+        try:
+            import uvloop
+            asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
+            logging.getLogger('startup').info('Using uvloop')
+        except ImportError:
+            logging.getLogger('startup').warning('uvloop not installed, using default event loop')
     loop = asyncio.get_event_loop()
     pm = pluggy.PluginManager("rumba-remote")
     pm.add_hookspecs(controller.InputHandler)
@@ -38,12 +46,15 @@ if __name__ == "__main__":
     for sig in (signal.SIGINT, signal.SIGTERM):
         loop.add_signal_handler(sig, inputHandler.onClose)
 
+    # schedule the first sync and the other startup tasks, does not wait for the jukebox
+    loop.run_until_complete(inputHandler.initTasks())
+
     # register device handler
     import importlib
     log = logging.getLogger('startup')
     for device in conf['io']['devices']:
         log.debug('Initializing %s', device['type'])
-        if device['type'] in ['display', 'keyboard', 'gpio', 'touch', 'signal']:
+        if device['type'] in ['display', 'keyboard', 'gpio', 'touch', 'signal', 'socket', 'shm', 'mpris']:
             try:
                 dev = importlib.import_module(f"devices.{device['type']}")
                 pm.register(dev.Handler(device, inputHandler, loop))
@@ -55,6 +66,7 @@ if __name__ == "__main__":
                 sys.exit(f"Please review your config\n{me}")
         else:
             log.warning('unknown device type: %s', device['type'])
+    inputHandler.devicesRegistered()
 
     try:
         loop.run_forever()
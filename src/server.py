@@ -1,22 +1,99 @@
 import asyncio
+import hashlib
 import logging
 import os.path
+import secrets
+import time
 from collections import namedtuple
+from collections.abc import Sequence
 from dataclasses import dataclass, field
-from typing import Any, List
+from typing import Any
 from multidict import MultiDict
 import aiohttp
+import yarl
+from config import readState, writeState
+from history import HistoryRecorder
+from monitor import tracer
 
 # feedback for ui-updates, immutable 'constants' via namedtuple
 CHANGES = ['POS', 'TRACK', 'PLAY', 'PLS']
 CHANGE = namedtuple('changeConstants', CHANGES)._make(range(len(CHANGES)))
 
 
+class Playlist(Sequence):
+    """ Windowed view of the jukebox playlist: ids are kept for all entries,
+        full song metadata only for a window around the current index
+        (window=0 keeps everything). Entries outside of the window are
+        returned as stubs with just their id, the connector hydrates
+        entries lazily when they move into the window
+    """
+    def __init__(self, entries=None, curIndex=-1, window=0):
+        entries = entries or []
+        self.ids = [entry['id'] for entry in entries]
+        self.window = window
+        self.songs = {}  # index -> song metadata
+        start, end = self._range(curIndex)
+        for index in range(start, end):
+            self.songs[index] = entries[index]
+
+    def _range(self, curIndex):
+        """ playlist indices covered by the window around curIndex """
+        if self.window <= 0:
+            return (0, len(self.ids))
+        curIndex = max(curIndex, 0)
+        return (max(curIndex - self.window, 0), min(curIndex + self.window + 1, len(self.ids)))
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self.ids)))]
+        if index < 0:
+            index += len(self.ids)
+        if not 0 <= index < len(self.ids):
+            raise IndexError('playlist index out of range')
+        if index in self.songs:
+            return self.songs[index]
+        return {'id': self.ids[index]}  # outside of window
+
+    def moveWindow(self, curIndex):
+        """ drops metadata outside of the window around curIndex,
+            returns indices that moved into the window and need hydration
+        """
+        if self.window <= 0:
+            return []
+        start, end = self._range(curIndex)
+        for index in [index for index in self.songs if not start <= index < end]:
+            del self.songs[index]
+        missing = []
+        for index in range(start, end):
+            if index not in self.songs:
+                self.songs[index] = {'id': self.ids[index]}  # stub gets updated in place when hydrated
+                missing.append(index)
+        return missing
+
+    @staticmethod
+    def isStub(song):
+        """ entry without metadata, only its id (outside of the window or not hydrated yet) """
+        return len(song) == 1
+
+    def hydrate(self, index, song):
+        """ adds fetched metadata to an entry if it is still inside the window """
+        if index in self.songs and self.songs[index]['id'] == song['id']:
+            self.songs[index].update(song)
+
+    def dehydrate(self, index):
+        """ removes a stub that could not be hydrated, retried on next window move """
+        if index in self.songs and self.isStub(self.songs[index]):
+            del self.songs[index]
+
+
 @dataclass
 class JukeboxState:
     """ synchronized local copy of the relevant jukebox server state """
     playing: bool = False
-    curSongs: List[Any] = field(default_factory=list)  # PLS running on jukebox (..List[Song])
+    curSongs: Playlist = field(default_factory=Playlist)  # PLS running on jukebox
     curIndex: int = -1
     curSong: Any = None  # ..Optional[Song]
     curPos: int = 0
@@ -27,7 +104,7 @@ class JukeboxState:
             (no new object because it is shared with the controller)
         """
         self.__dict__.update(
-            {'playing': False, 'curSongs': [], 'curSong': None, 'curIndex': -1, 'curPos': 0, 'lastModPLS': 0})
+            {'playing': False, 'curSongs': Playlist(), 'curSong': None, 'curIndex': -1, 'curPos': 0, 'lastModPLS': 0})
 
 
 class JukeboxError(Exception):
@@ -38,7 +115,46 @@ class NotFoundError(Exception):
     """ Exception: No connection to jukebox """
 
 
-class Connector():
+class Auth():
+    """ Auth and client params shared by all requests, encoded once per salt:
+        token auth sends t = md5(password + salt) and s = salt (api 1.13.0),
+        legacy auth the plain password like older versions of the remote
+    """
+    def __init__(self, config):
+        self.log = logging.getLogger('serv')
+        self.username = config['username']
+        self.password = config['password']
+        self.tokenAuth = config['tokenAuth']  # salted token instead of password in every request
+        self.saltLifetime = config['saltLifetime']  # seconds until a new salt/token gets generated
+        self.expires = 0
+        self.encoded = None
+
+    def query(self):
+        """ encoded auth/client query string, a new salt/token after saltLifetime """
+        if time.monotonic() >= self.expires:
+            if self.tokenAuth:
+                salt = secrets.token_hex(8)
+                token = hashlib.md5(f'{self.password}{salt}'.encode('utf-8')).hexdigest()
+                auth = {'u': self.username, 't': token, 's': salt, 'v': '1.13.0'}
+            else:
+                auth = {'u': self.username, 'p': self.password, 'v': '1.9.23'}
+            self.encoded = yarl.URL.build(query={**auth, 'c': 'rumba-remote', 'f': 'json'}).raw_query_string
+            self.expires = time.monotonic() + self.saltLifetime if self.tokenAuth else float('inf')
+        return self.encoded
+
+    def fallback(self):
+        """ switch to legacy auth once if the server does not support tokens,
+            returns False if legacy auth is already used
+        """
+        if not self.tokenAuth:
+            return False
+        self.log.warning('Token auth not supported by the jukebox, falling back to password auth')
+        self.tokenAuth = False
+        self.expires = 0
+        return True
+
+
+class Connector():  # pylint: disable=too-many-instance-attributes
     """ Connection to jukebox server
         keeps a synchronized local copy of the relevant jukebox state,
         wraps all jukebox actions and passes back state-changes
@@ -50,84 +166,248 @@ class Connector():
         self.baseurl = config['url']
         self.localServer = ('localhost' in self.baseurl or '://127.' in self.baseurl or self.baseurl.startswith('127.'))
         self.cacheDir = config['cacheDir']
-        self.username = config['username']
-        self.password = config['password']
+        self.auth = Auth(config)
         self.excludeFolders = config['exclude']  # exclude parts of jukebox library (getRandomSongs)
+        self.playlistWindow = config['playlistWindow']  # songs around current track with full metadata
+        self.optimisticUpdates = config['optimisticUpdates']  # update local state before the jukebox answers
+        self.prediction = None  # pending optimistic update: action, args for the call and values for rollback
         # cached jukebox state
         self.jukebox = JukeboxState()
 
-        self.savedState = None  # restore jukebox state if server gets stopped (eg for a emulator session)
         self.http = None  # connection via aiohttp-session
         self.log = logging.getLogger('serv')
         self.log.setLevel(config['logLevel'])  # can be different than general logLevel
 
+        # restore jukebox state if server gets stopped (eg for a emulator session)
+        # persisted on disk to survive restarts of the remote as well
+        self.stateFile = config['stateFile']
+        self.snapshotInterval = config['snapshotInterval']  # seconds, 0 disables periodic snapshots
+        self.lastSnapshot = (0, None)  # time and content of the last snapshot written
+        self.savedState = readState(self.stateFile)
+        if self.savedState is not None:
+            self.log.debug('Jukebox state loaded from %s', self.stateFile)
+
+        # local play history
+        self.history = None
+        if config['historyDir']:
+            try:
+                self.history = HistoryRecorder(config['historyDir'], config['historyDays'])
+            except OSError as oe:
+                self.log.warning('Play history disabled, %s not available: %s', config['historyDir'], oe)
+
     def initSession(self):
-        """ async init of http session """
-        self.http = aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(20))
-
-    def saveState(self):
-        """ save current state before stopping jukebox service """
-        self.savedState = {'songs': [int(song['id']) for song in self.jukebox.curSongs],
-                           'index': self.jukebox.curIndex,
-                           'pos': self.jukebox.curPos}
+        """ async init of http session, connections are kept alive between status polls """
+        self.http = aiohttp.ClientSession(
+            timeout=aiohttp.ClientTimeout(20),
+            connector=aiohttp.TCPConnector(keepalive_timeout=60))
+
+    def close(self):
+        """ shutdown: write out pending play history """
+        if self.history is not None:
+            self.history.close()
+
+    def pauseHistory(self):
+        """ no played time gets counted until the next successful update """
+        if self.history is not None:
+            self.history.pause()
+
+    async def saveState(self):
+        """ save current state before stopping jukebox service,
+            the file gets written in an executor
+        """
+        self.savedState = self._currentState()
+        await asyncio.get_event_loop().run_in_executor(None, self._writeStateFile, self.savedState)
         self.log.debug('Jukebox state saved!')
 
+    def snapshotState(self):
+        """ periodically persist the running jukebox state, so an
+            unexpected server stop or crash of the remote loses as little as possible
+            (state file only gets rewritten if something changed).
+            savedState is kept in sync to restore the jukebox after a reconnect, see _recoverState().
+            A playlist emptied by the user (the jukebox reports a modified playlist) clears the state
+        """
+        if self.snapshotInterval <= 0:
+            return
+        emptied = len(self.jukebox.curSongs) == 0 and self.jukebox.lastModPLS > 0
+        if len(self.jukebox.curSongs) > 0 or (emptied and self.savedState is not None and self.savedState['songs']):
+            lastTime, lastState = self.lastSnapshot
+            if emptied or time.monotonic() - lastTime >= self.snapshotInterval:
+                state = self._currentState()
+                if state != lastState:
+                    self._writeStateFile(state)
+                    self.log.debug('Jukebox state snapshot written')
+                self.lastSnapshot = (time.monotonic(), state)
+                self.savedState = state
+
+    def _currentState(self):
+        """ playlist ids and position needed to restore the jukebox """
+        return {'songs': [int(songId) for songId in self.jukebox.curSongs.ids],
+                'index': self.jukebox.curIndex,
+                'pos': self.jukebox.curPos}
+
+    def _writeStateFile(self, state):
+        """ write-rename state file, a failing disk must not stop the remote """
+        try:
+            writeState(self.stateFile, state)
+        except OSError as oe:
+            self.log.warning('Writing jukebox state to %s failed: %s', self.stateFile, oe)
+
     async def restoreState(self):
         """ restore jukebox state if server gets stopped (eg for a retropie session) """
         if self.savedState is not None and self.savedState['songs']:
             await self._setPLS(self.savedState['songs'], self.savedState['index'], self.savedState['pos'])
             self.serverCallback(CHANGE.PLS)
             self.log.debug('Jukebox state restored!')
-        self.savedState = None
+
+    async def _recoverState(self):
+        """ restore persisted state after (re-)connecting to a jukebox that lost its playlist
+            (eg the remote restarted during an emulator session or the server stopped unexpectedly)
+        """
+        if len(self.jukebox.curSongs) == 0:
+            await self.restoreState()  # whole playlist gets set with a single request
+        else:
+            self.savedState = self._currentState()  # jukebox kept its playlist, nothing to restore
+
+    def predict(self, action):
+        """ optimistic update: applies the expected result of an action to the local state
+            before the jukebox gets called, returns the change for immediate ui updates.
+            call() sends the action with the targets computed here and reconciles with
+            the jukebox response, the local state gets reverted if the call fails
+        """
+        if not self.optimisticUpdates or self.prediction is not None or len(self.jukebox.curSongs) == 0:
+            return None
+        playing = self.jukebox.playing
+        if action == 'startStop':
+            args = {'start': not playing}
+        elif action == 'nextSong':
+            args = {'index': self._nextIndex(), 'playing': playing}
+        elif action == 'prevSong':
+            args = {'index': self._prevIndex(), 'playing': playing}
+        else:
+            return None
+        self.prediction = {'action': action, 'args': args,
+                           'rollback': (playing, self.jukebox.curIndex, self.jukebox.curPos)}
+        self.log.debug('Predicting %s(%s)', action, args)
+        if action == 'startStop':
+            self.jukebox.playing = args['start']
+            return CHANGE.PLAY
+        self.jukebox.curPos = 0
+        if self.jukebox.curIndex != args['index']:
+            self.jukebox.curIndex = args['index']
+            self.setCurSong()
+            return CHANGE.TRACK
+        return CHANGE.POS
+
+    def revert(self):
+        """ rollback of a failed optimistic update, returns the change """
+        if self.prediction is None:
+            return None
+        self.log.debug('Reverting %s', self.prediction['action'])
+        playing, curIndex, curPos = self.prediction['rollback']
+        self.prediction = None
+        self.jukebox.playing = playing
+        self.jukebox.curPos = curPos
+        if self.jukebox.curIndex != curIndex:
+            self.jukebox.curIndex = curIndex
+            self.setCurSong()
+            return CHANGE.TRACK
+        return CHANGE.PLAY
 
     async def call(self, action, **kwargs):
         """ wraps all jukebox actions to be able to determine state changes
             after the jukebox calls are done. the state-change gets passed back
             to the controller to trigger corresponding UI-updates """
+        if self.prediction is not None:
+            if self.prediction['action'] != action:
+                if action == 'getStatus':  # status poll would undo the prediction until the action is sent
+                    return None
+            else:
+                kwargs = {**self.prediction['args'], **kwargs}
         self.log.debug('Jukebox call %s(%s)', action, kwargs)
+        with tracer.span(f'jukebox.{action}'):
+            try:
+                return await self._call(action, **kwargs)
+            except (Exception, asyncio.CancelledError) as e:
+                if isinstance(e, (JukeboxError, NotFoundError)):
+                    self.pauseHistory()
+                if self.prediction is not None and self.prediction['action'] == action:  # undo this action only
+                    change = self.revert()
+                    if change is not None:
+                        self.serverCallback(change)
+                raise
+            finally:
+                if self.prediction is not None and self.prediction['action'] == action:
+                    self.prediction = None
+
+    async def _call(self, action, **kwargs):
+        """ jukebox action and update of the local state """
         change = None
         resp = await getattr(self, f'_{action}')(**kwargs)
         if resp is None:  # all actions return a response on success -> update status if action failed
             resp = await self._getStatus()
         if resp['subsonic-response'].get('jukeboxStatus', False):
-            if self.jukebox.curPos != resp['subsonic-response']['jukeboxStatus']['position']:
-                self.jukebox.curPos = resp['subsonic-response']['jukeboxStatus']['position']
-                change = CHANGE.POS
-            if self.jukebox.curIndex != resp['subsonic-response']['jukeboxStatus']['currentIndex']:
-                self.jukebox.curIndex = resp['subsonic-response']['jukeboxStatus']['currentIndex']
-                self.setCurSong()
-                change = CHANGE.TRACK
-            if self.jukebox.playing != resp['subsonic-response']['jukeboxStatus']['playing']:
-                self.jukebox.playing = resp['subsonic-response']['jukeboxStatus']['playing']
-                change = CHANGE.PLAY
+            change = self._applyStatus(resp['subsonic-response']['jukeboxStatus'])
             # jukebox signals playlist changes by updating lastMod timestamp
             # updates of the local playlist (self.jukebox.curSongs) are all triggered by this
             if resp['subsonic-response']['jukeboxStatus']['lastMod'] > self.jukebox.lastModPLS:
                 resp = await self._fetch('jukeboxControl', {'action': 'get'})  # get new playlist data
-                if resp['subsonic-response']['jukeboxPlaylist']['lastMod'] > self.jukebox.lastModPLS:
-                    # use changes from getPlaylist() response to avoid getting out of sync
-                    self.jukebox.lastModPLS = resp['subsonic-response']['jukeboxPlaylist']['lastMod']
-                    self.jukebox.curIndex = resp['subsonic-response']['jukeboxPlaylist']['currentIndex']
-                    self.jukebox.curPos = resp['subsonic-response']['jukeboxPlaylist']['position']
-                    self.jukebox.playing = resp['subsonic-response']['jukeboxPlaylist']['playing']
-                    self.jukebox.curSongs = resp['subsonic-response']['jukeboxPlaylist']['entry']
-                    self.setCurSong()
+                if self._applyPlaylist(resp['subsonic-response']['jukeboxPlaylist']) is not None:
                     change = CHANGE.PLS
+        elif resp['subsonic-response'].get('jukeboxPlaylist', False):  # playlist requested directly (sync)
+            change = self._applyPlaylist(resp['subsonic-response']['jukeboxPlaylist'])
         elif action == 'star':  # star returns empty 'subsonic-response' on success
             change = CHANGE.TRACK
+        if self.history is not None:
+            songs, index = self.jukebox.curSongs, max(self.jukebox.curIndex, 0)
+            songId = songs.ids[index] if index < len(songs) else None
+            self.history.update(songId, self.jukebox.playing, self.jukebox.curPos)
         self.log.debug('Change result of jukebox action: %s', change)
         return change
 
+    def _applyStatus(self, status):
+        """ updates local state from a jukeboxStatus response, returns the change """
+        change = None
+        if self.jukebox.curPos != status['position']:
+            self.jukebox.curPos = status['position']
+            change = CHANGE.POS
+        if self.jukebox.curIndex != status['currentIndex']:
+            self.jukebox.curIndex = status['currentIndex']
+            self.setCurSong()
+            change = CHANGE.TRACK
+        if self.jukebox.playing != status['playing']:
+            self.jukebox.playing = status['playing']
+            change = CHANGE.PLAY
+        return change
+
+    def _applyPlaylist(self, playlist):
+        """ updates local state from a jukeboxPlaylist response if it is newer """
+        if playlist['lastMod'] > self.jukebox.lastModPLS:
+            # use changes from getPlaylist() response to avoid getting out of sync
+            self.jukebox.lastModPLS = playlist['lastMod']
+            self.jukebox.curIndex = playlist['currentIndex']
+            self.jukebox.curPos = playlist['position']
+            self.jukebox.playing = playlist['playing']
+            self.jukebox.curSongs = Playlist(playlist['entry'], self.jukebox.curIndex, self.playlistWindow)
+            self.setCurSong()
+            return CHANGE.PLS
+        return None
+
     def setCurSong(self):
         """ sets currently playing track on track-change and
             starts async request of folder image if not present """
         curSong = None
+        missing = self.jukebox.curSongs.moveWindow(self.jukebox.curIndex)
+        if missing:
+            asyncio.ensure_future(self._hydrate(missing, self.jukebox.lastModPLS))
         if len(self.jukebox.curSongs) > 0 and len(self.jukebox.curSongs) > self.jukebox.curIndex:
             if self.jukebox.curIndex > -1:
                 curSong = self.jukebox.curSongs[self.jukebox.curIndex]
             else:
                 curSong = self.jukebox.curSongs[0]
-            if self.displayRes is not None:
+            if Playlist.isStub(curSong) and self.jukebox.curSong is not None:
+                # stub outside of the window: keep the previous song until _hydrate() fetched the new one
+                curSong = self.jukebox.curSong
+            if self.displayRes is not None and 'coverArt' in curSong:  # stubs get their cover once hydrated
                 try:  # check if cover has already been requested
                     _ = curSong['coverScreenPath']
                 except KeyError:
@@ -139,6 +419,29 @@ class Connector():
         self.jukebox.curSong = curSong
         # return curSong
 
+    async def _hydrate(self, indices, lastModRequest):
+        """ fetches metadata for playlist entries that moved into the window,
+            nearest to the current track first and a few requests at a time
+        """
+        indices = sorted(indices, key=lambda index: abs(index - self.jukebox.curIndex))
+        for chunk in range(0, len(indices), 8):
+            chunkIndices = indices[chunk:chunk + 8]
+            resps = await asyncio.gather(
+                *[self._fetch('getSong', {'id': self.jukebox.curSongs.ids[index]}) for index in chunkIndices],
+                return_exceptions=True)
+            if self.jukebox.lastModPLS != lastModRequest:  # guard against PLS changes while waiting for response
+                return
+            for index, resp in zip(chunkIndices, resps):
+                if isinstance(resp, Exception) or resp is None:
+                    self.log.debug('Fetching metadata failed (index: %s): %s', index, resp)
+                    self.jukebox.curSongs.dehydrate(index)
+                else:
+                    self.jukebox.curSongs.hydrate(index, resp['subsonic-response']['song'])
+            self.log.debug('Playlist entries hydrated: %s', chunkIndices)
+            if self.jukebox.curIndex in chunkIndices or (self.jukebox.curIndex < 0 and 0 in chunkIndices):
+                self.setCurSong()
+                self.serverCallback(CHANGE.TRACK)
+
     async def _getCover(self, covId, plsIndex, lastModRequest):
         """ fetches path to scaled cover art from jukebox (might take a while if it has to be created) """
         if self.localServer:
@@ -191,7 +494,7 @@ class Connector():
         """ add full album around currently playing track or 20 random songs from the same artist """
         if self.jukebox.curIndex > -1 and len(self.jukebox.curSongs) > self.jukebox.curIndex:
             curIndex = self.jukebox.curIndex
-            curSongIDs = [song.get('id') for song in self.jukebox.curSongs]
+            curSongIDs = list(self.jukebox.curSongs.ids)
             # add album if not currently playing
             albumPlaying = False
             curAlbumID = self.jukebox.curSongs[curIndex].get('albumId', 0)
@@ -224,12 +527,24 @@ class Connector():
             if newSongIDs:
                 return await self._setPLS(curSongIDs)
 
-    async def _prevSong(self):
-        """ restart playback of current track or play previous track if already at the beginning """
-        newIndex = self.jukebox.curIndex
+    def _prevIndex(self):
+        """ index for prevSong: restart current track if already playing a while """
         if self.jukebox.curPos < 10 and self.jukebox.curIndex > 0:
-            newIndex -= 1
-        if self.jukebox.playing:
+            return self.jukebox.curIndex - 1
+        return self.jukebox.curIndex
+
+    def _nextIndex(self):
+        """ index for nextSong: first track at end of playlist """
+        if self.jukebox.curIndex + 1 < len(self.jukebox.curSongs):
+            return self.jukebox.curIndex + 1
+        return 0
+
+    async def _prevSong(self, index=None, playing=None):
+        """ restart playback of current track or play previous track if already at the beginning
+            (index/playing are passed if the local state has already been updated, see predict)
+        """
+        newIndex = self._prevIndex() if index is None else index
+        if self.jukebox.playing if playing is None else playing:
             await self._fetch('jukeboxControl', {'action': 'skip', 'index': newIndex, 'offset': 0})
         else:
             await self._fetch('jukeboxControl', {'action': 'skip', 'index': newIndex, 'offset': 0})
@@ -237,16 +552,16 @@ class Connector():
             # we don't want this here to be able to skip through a playlist without playback
             return await self._fetch('jukeboxControl', {'action': 'stop'})
 
-    async def _startStop(self):
+    async def _startStop(self, start=None):
         """ start/stop toggle playback """
-        return await self._fetch('jukeboxControl', {'action': ('stop' if self.jukebox.playing else 'start')})
+        if start is None:
+            start = not self.jukebox.playing
+        return await self._fetch('jukeboxControl', {'action': ('start' if start else 'stop')})
 
-    async def _nextSong(self):
+    async def _nextSong(self, index=None, playing=None):
         """ play next track or restart playback with first track at end of playlist """
-        newIndex = 0
-        if self.jukebox.curIndex + 1 < len(self.jukebox.curSongs):
-            newIndex = self.jukebox.curIndex + 1
-        if self.jukebox.playing:
+        newIndex = self._nextIndex() if index is None else index
+        if self.jukebox.playing if playing is None else playing:
             return await self._fetch('jukeboxControl', {'action': 'skip', 'index': newIndex, 'offset': 0})
         # skip through playlist without playback
         await self._fetch('jukeboxControl', {'action': 'skip', 'index': newIndex, 'offset': 0})
@@ -281,30 +596,54 @@ class Connector():
         """ on/off switch video out """
         return await self._fetch('jukeboxControl', {'action': 'toggleVideoOut', 'enabled': enabled})
 
+    async def _sync(self):
+        """ first sync after (re-)connecting: status and playlist are requested in parallel,
+            if the (small) status arrives first it gets passed on right away
+            so the first frame does not have to wait for the playlist
+        """
+        statusReq = asyncio.ensure_future(self._getStatus())
+        plsReq = asyncio.ensure_future(self._fetch('jukeboxControl', {'action': 'get'}))
+        try:
+            done, _ = await asyncio.wait((statusReq, plsReq), return_when=asyncio.FIRST_COMPLETED)
+            if statusReq in done and plsReq not in done and statusReq.result() is not None:  # None: cancelled
+                change = self._applyStatus(statusReq.result()['subsonic-response']['jukeboxStatus'])
+                if change is not None:
+                    self.serverCallback(change)
+            return await plsReq
+        finally:
+            for req in (statusReq, plsReq):
+                if not req.done():
+                    req.cancel()
+                elif not req.cancelled():
+                    req.exception()  # mark as retrieved, errors are raised by the awaited request
+
     async def _getStatus(self):
         """ get current state from jukebox - does not include playlist/track metadata """
         return await self._fetch('jukeboxControl', {'action': 'status'})
 
     async def _fetch(self, endpoint, params):
         """ communication with jukebox server - errors in response will result in exceptions """
-        params.update({'u': self.username, 'p': self.password, 'v': '1.9.23', 'c': 'rumba-remote', 'f': 'json'})
         try:
-            url = f'{self.baseurl}{endpoint}.view'
-            self.log.debug('GET %s / %s', url, params)
-            async with self.http.get(url, params=params) as response:
-                if response.headers['Content-Type'] == 'image/jpeg':
-                    return await response.content.read()
-                # XXX: non-json-resp (error-) handling
-                resp = await response.json()
-                self.log.debug('RESP: %s', resp)
-                try:
-                    status = resp['subsonic-response']['status']
-                    if status != 'ok':  # standard error msg from server
-                        raise JukeboxError(f"Jukebox Error: {resp['subsonic-response']['error']['message']}")
-                except KeyError:
-                    self.log.critical('Invalid response from server: %s', resp)
-                    raise JukeboxError('Invalid response, could not parse!')
-                return resp
+            self.log.debug('GET %s / %s', endpoint, params)  # no credentials in the logs
+            query = '&'.join(filter(None, (yarl.URL.build(query=params).raw_query_string, self.auth.query())))
+            url = yarl.URL(f'{self.baseurl}{endpoint}.view?{query}', encoded=True)
+            with tracer.span(f'fetch.{endpoint}'):
+                async with self.http.get(url) as response:
+                    if response.headers['Content-Type'] == 'image/jpeg':
+                        return await response.content.read()
+                    # XXX: non-json-resp (error-) handling
+                    resp = await response.json()
+                    self.log.debug('RESP: %s', resp)
+                    try:
+                        status = resp['subsonic-response']['status']
+                        if status != 'ok':  # standard error msg from server
+                            if resp['subsonic-response']['error'].get('code') in (30, 41) and self.auth.fallback():
+                                return await self._fetch(endpoint, params)  # no token support
+                            raise JukeboxError(f"Jukebox Error: {resp['subsonic-response']['error']['message']}")
+                    except KeyError:
+                        self.log.critical('Invalid response from server: %s', resp)
+                        raise JukeboxError('Invalid response, could not parse!')
+                    return resp
         except asyncio.CancelledError:
             return  # task cancelled -> shutdown etc, just return
         except asyncio.exceptions.TimeoutError:
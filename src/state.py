@@ -0,0 +1,91 @@
+from collections import namedtuple
+from dataclasses import dataclass, field
+from typing import Tuple, Optional, Any
+import server as jukebox
+
+# power states: periodic work (polling, rendering, led effects) gets stretched or suspended while nothing happens
+POWER = namedtuple('powerConstants', ['ACTIVE', 'IDLE', 'SLEEP'])._make(['active', 'idle', 'sleep'])
+
+
+@dataclass
+class State:
+    """ All internal state that can be shared with addons (eg display) """
+    jukebox: jukebox.JukeboxState
+    menu: Optional[Tuple[str, ...]] = None  # actions currently shown in menu
+    menuPage: Optional[int] = None  # currently shown menu page
+    activeModule: Optional[Any] = None  # Optional[Module]
+    requestRunning: bool = False  # synchronizes user interaction with the Jukebox
+    confirmState: Optional[bool] = None  # modal confirmation dialog
+    confirmTarget: Optional[int] = None  # for user input that has to be confirmed with dialog
+    confirmText: str = ''  # text for confirmation dialog
+    alert: str = ''  # text for alert dialog
+    power: str = POWER.ACTIVE  # see InputHandler.updatePower()
+    version: int = 0  # incremented with every committed change (see commitChanges)
+    committed: dict = field(default_factory=dict, repr=False)  # tracked values of the last commit
+
+    def trackedFields(self):
+        """ Values compared by commitChanges(), keys are the names passed with onStateDelta """
+        curSong = self.jukebox.curSong or {}
+        return {
+            'pos': self.jukebox.curPos,
+            # changes when a stub gets hydrated (see server.Playlist) and when the cover path is fetched
+            'track': (self.jukebox.lastModPLS, self.jukebox.curIndex, curSong.get('id'), curSong.get('starred'),
+                      jukebox.Playlist.isStub(curSong), curSong.get('coverScreenPath')),
+            'play': self.jukebox.playing,
+            'menu': (self.menuPage, self.menu),
+            'confirm': (self.confirmState, self.confirmTarget, self.confirmText),
+            'alert': self.alert,
+            'request': self.requestRunning,
+            'mode': self.activeModule.name if self.activeModule is not None else None,
+            'power': self.power,
+        }
+
+    def commitChanges(self):
+        """ Compares tracked fields with the last commit,
+            returns the names of all changed fields (empty if nothing changed)
+        """
+        current = self.trackedFields()
+        changes = frozenset(key for key, value in current.items() if self.committed.get(key, ()) != value)
+        if changes:
+            self.committed = current
+            self.version += 1
+        return changes
+
+    @property
+    def bgImage(self):
+        """ Optional path to current background image, None gets default image """
+        if self.activeModule is not None:
+            return self.activeModule.getBackgroundImage()
+        return None  # use default image
+
+    @property
+    def rumbaActive(self):
+        """ Info about toggle between rumba jukebox and modal addons """
+        return self.activeModule.name == 'rumba'
+
+    @property
+    def toggleAction(self):
+        """ Action for toggle button """
+        return 'MENU.TOGGLE' if self.activeModule.name == 'rumba' else 'RUMBA.ENABLE'
+
+    def export(self):
+        """ json serializable copy of the state for external clients (eg io.socket) """
+        song = None
+        if self.jukebox.curSong is not None:
+            song = {key: self.jukebox.curSong.get(key)
+                    for key in ('id', 'title', 'artist', 'album', 'duration', 'starred')}
+        return {
+            'version': self.version,
+            'mode': self.activeModule.name if self.activeModule is not None else None,
+            'power': self.power,
+            'playing': self.jukebox.playing,
+            'pos': self.jukebox.curPos,
+            'index': self.jukebox.curIndex,
+            'tracks': len(self.jukebox.curSongs),
+            'song': song,
+            'menuPage': self.menuPage,
+            'menu': list(self.menu) if self.menu is not None else None,
+            'requestRunning': self.requestRunning,
+            'confirmTarget': self.confirmTarget,
+            'alert': self.alert,
+        }
@@ -0,0 +1,94 @@
+import asyncio
+import logging
+import math
+
+
+class TimerHandle():
+    """ Scheduled callback of the TimerService, can be cancelled """
+    __slots__ = ('service', 'deadline', 'callback', 'args', 'cancelled')
+
+    def __init__(self, service, deadline, callback, args):
+        self.service = service
+        self.deadline = deadline
+        self.callback = callback
+        self.args = args
+        self.cancelled = False
+
+    def cancel(self):
+        """ callback will not be called """
+        if not self.cancelled:
+            self.cancelled = True
+            self.service._remove(self)  # pylint: disable=protected-access
+
+
+class TimerService():
+    """ Central scheduler for all timers of the controller and plugins
+        (status polling, menu timeout, clock, screensaver, animations..)
+
+        Deadlines get aligned to a grid of 'slack' seconds and timers
+        due in the same slot share a single wakeup of the event loop,
+        a timer joins an already scheduled wakeup if that is not
+        more than its slack later. Every timer can be scheduled with
+        its own slack, eg seconds for a clock and none for animations
+    """
+    def __init__(self, slack=0.05):
+        self.log = logging.getLogger('timers')
+        self.slack = slack  # default slack in seconds
+        self.buckets = {}  # deadline -> [loop timer handle, TimerHandles in order of scheduling]
+        self.wakeups = 0  # event loop wakeups caused by timers
+
+    def callLater(self, delay, callback, *args, slack=None):
+        """ call callback(*args) after delay seconds, but up to slack seconds later """
+        slack = self.slack if slack is None else slack
+        loop = asyncio.get_event_loop()
+        deadline = loop.time() + delay
+        # join an already scheduled wakeup in range
+        joined = [key for key in self.buckets if deadline <= key <= deadline + slack]
+        if joined:
+            deadline = min(joined)
+        else:
+            if slack > 0:
+                deadline = round(math.ceil(deadline / slack) * slack, 6)
+            self.buckets[deadline] = [loop.call_at(deadline, self._fire, deadline), {}]
+        handle = TimerHandle(self, deadline, callback, args)
+        self.buckets[deadline][1][handle] = None
+        return handle
+
+    async def sleep(self, delay, slack=None):
+        """ asyncio.sleep() with slack """
+        future = asyncio.get_event_loop().create_future()
+        handle = self.callLater(delay, self._wake, future, slack=slack)
+        try:
+            await future
+        finally:
+            handle.cancel()
+
+    @staticmethod
+    def _wake(future):
+        if not future.done():
+            future.set_result(None)
+
+    def _fire(self, deadline):
+        """ loop timer: run all callbacks of this slot """
+        self.wakeups += 1
+        _, handles = self.buckets.pop(deadline, (None, ()))
+        for handle in handles:
+            if not handle.cancelled:
+                handle.cancelled = True  # done
+                try:
+                    handle.callback(*handle.args)
+                except Exception:  # pylint: disable=broad-except
+                    self.log.exception('Timer callback %s failed', handle.callback)
+
+    def _remove(self, handle):
+        """ remove cancelled timer, drops the wakeup if no other timer needs it """
+        bucket = self.buckets.get(handle.deadline)
+        if bucket is not None:
+            bucket[1].pop(handle, None)
+            if not bucket[1]:
+                bucket[0].cancel()
+                del self.buckets[handle.deadline]
+
+    def getStats(self):
+        """ wakeups so far and currently scheduled wakeups """
+        return {'wakeups': self.wakeups, 'scheduled': len(self.buckets)}
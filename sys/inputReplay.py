@@ -0,0 +1,326 @@
+#!/usr/bin/python3
+""" Replays recorded user input (see [logging] inputRecordFile) against a stand-in
+    jukebox server for deterministic load tests of the controller:
+    throughput, queueing (merged/dropped input), input latency and ui update counts
+
+    eg: sys/inputReplay.py input.rec --speed 10 --latency 50 --trace /tmp/replay.json
+
+    All input gets replayed, but only jukebox actions are run: addon actions (emulators,
+    shutdown..) and key injection are skipped and counted after menu buttons and macros
+    have been resolved. No devices are initialized, state/history files are kept
+    in a temporary directory
+"""
+import argparse
+import asyncio
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+from collections import Counter
+from aiohttp import web
+import pluggy
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), '..', 'src'))
+from config import readConfig, ConfigError  # noqa: E402 pylint: disable=wrong-import-position
+import controller  # noqa: E402 pylint: disable=wrong-import-position
+from monitor import tracer  # noqa: E402 pylint: disable=wrong-import-position
+from keyinjector import KeyInjector  # noqa: E402 pylint: disable=wrong-import-position
+from recorder import readRecording  # noqa: E402 pylint: disable=wrong-import-position
+
+hookimpl = pluggy.HookimplMarker("rumba-remote")
+
+
+class FakeJukebox():
+    """ Stand-in Subsonic server: just the jukebox api used by the connector,
+        every request is answered after 'latency' seconds
+    """
+    def __init__(self, tracks=200, latency=0.02):
+        self.latency = latency
+        self.songs = {str(i): {
+            'id': str(i), 'title': f'Track {i}', 'artist': f'Artist {i % 10}', 'artistId': i % 10,
+            'album': f'Album {i // 10}', 'albumId': i // 10 + 1, 'parent': str(i // 10), 'duration': 180,
+        } for i in range(tracks)}
+        self.playlist = list(self.songs)[:50]
+        self.index = 0
+        self.playing = False
+        self.position = 0
+        self.since = time.monotonic()  # start of playback at position
+        self.lastMod = int(time.time() * 1000)
+        self.requests = Counter()  # endpoint/action -> number of requests
+        self.runner = None  # aiohttp app runner, see start()
+
+    def _pos(self):
+        """ current playback position in seconds """
+        if self.playing:
+            return self.position + int(time.monotonic() - self.since)
+        return self.position
+
+    def _status(self):
+        """ jukeboxStatus payload """
+        return {'jukeboxStatus': {
+            'currentIndex': self.index, 'playing': self.playing, 'position': self._pos(), 'lastMod': self.lastMod}}
+
+    def _setPlaying(self, playing, position=None):
+        """ start/stop playback, keeps the current position if none is given """
+        self.position = self._pos() if position is None else position
+        self.since = time.monotonic()
+        self.playing = playing
+
+    def _jukeboxControl(self, query):
+        """ jukeboxControl actions used by the connector """
+        action = query.get('action')
+        self.requests[f'jukeboxControl.{action}'] += 1
+        if action == 'get':
+            return {'jukeboxPlaylist': {
+                'currentIndex': self.index, 'playing': self.playing, 'position': self._pos(), 'lastMod': self.lastMod,
+                'entry': [self.songs[songId] for songId in self.playlist]}}
+        if action == 'start':
+            self._setPlaying(True)
+        elif action == 'stop':
+            self._setPlaying(False)
+        elif action == 'skip':
+            self.index = min(int(query.get('index', 0)), len(self.playlist) - 1)
+            self._setPlaying(True, int(float(query.get('offset', 0))))
+        elif action == 'set':
+            self.playlist = [songId for songId in query.getall('id', []) if songId in self.songs]
+            self.index = 0
+            self._setPlaying(self.playing, 0)
+            self.lastMod = int(time.time() * 1000)
+        return self._status()
+
+    async def handle(self, request):
+        """ aiohttp handler for all endpoints """
+        await asyncio.sleep(self.latency)
+        endpoint = request.match_info['endpoint']
+        query = request.query
+        if endpoint == 'jukeboxControl':
+            payload = self._jukeboxControl(query)
+        else:
+            self.requests[endpoint] += 1
+            if endpoint == 'getSong':
+                payload = {'song': self.songs.get(query.get('id'), {'id': query.get('id')})}
+            elif endpoint == 'getRandomSongs':
+                payload = {'randomSongs': {'song': list(self.songs.values())[:int(query.get('size', 10))]}}
+            elif endpoint == 'getSimilarSongs':
+                payload = {'similarSongs': {'song': list(self.songs.values())[-int(query.get('count', 20)):]}}
+            elif endpoint == 'getMusicDirectory':
+                payload = {'directory': {'child': [
+                    song for song in self.songs.values() if song['parent'] == query.get('id')]}}
+            elif endpoint == 'getCoverScreen':
+                payload = {'imgPath': None}
+            else:  # star, unstar, ping..
+                payload = {}
+        return web.json_response({'subsonic-response': {'status': 'ok', 'version': '1.13.0', **payload}})
+
+    async def start(self):
+        """ listen on a free local port, returns the base url for the connector """
+        app = web.Application()
+        app.router.add_get('/rest/{endpoint}.view', self.handle)
+        self.runner = web.AppRunner(app)
+        await self.runner.setup()
+        site = web.TCPSite(self.runner, '127.0.0.1', 0)
+        await site.start()
+        port = self.runner.addresses[0][1]
+        return f'http://127.0.0.1:{port}/rest/'
+
+    async def close(self):
+        """ stop the server """
+        await self.runner.cleanup()
+
+
+class SkippedAddon():
+    """ Stand-in for every addon: no confirmation, actions are only counted """
+    def __init__(self, name, skipped):
+        self.name = name
+        self.skipped = skipped
+
+    def needsConfirm(self, func):
+        """ Module Interface: skipped actions are never confirmed """
+        return False
+
+    def getIcon(self, func):
+        """ Module Interface: no icons, the action name """
+        return f'{self.name}.{func}'
+
+    def getConfirmText(self, func):
+        """ Module Interface: no confirmation text """
+        return None
+
+    async def do(self, func, val=None):
+        """ Module Interface: count instead of running the action """
+        self.skipped[f'{self.name}.{func}'] += 1
+
+
+class ReplayHandler(controller.InputHandler):
+    """ Controller that only runs jukebox actions, addons and key injection
+        are skipped after the menu/macro resolution of the real controller
+    """
+    def __init__(self, *args, **kwargs):
+        self.skipped = Counter()  # action -> number of times skipped
+        super().__init__(*args, **kwargs)
+
+    def initKeyboard(self, config):
+        """ no keys registered: no virtual keyboard gets created """
+        return KeyInjector('rumba-replay')
+
+    def getModule(self, moduleName):
+        """ the controller itself for RUMBA/KEY, counting stand-ins for all addons """
+        if moduleName in ('RUMBA', 'KEY'):
+            return self
+        if moduleName not in self.modules:
+            self.modules[moduleName] = SkippedAddon(moduleName, self.skipped)
+        return self.modules[moduleName]
+
+    async def pressKey(self, key):
+        """ key injection is skipped and counted """
+        self.skipped[f'KEY.{key}'] += 1
+
+
+class UpdateCounter():
+    """ plugin counting ui relevant hooks like a display would see them """
+    def __init__(self):
+        self.hooks = Counter()
+
+    @hookimpl
+    def onUpdate(self, changes, state):
+        """ coalesced ui updates """
+        self.hooks['onUpdate'] += 1
+
+    @hookimpl
+    def onStateDelta(self, changes, state):
+        """ state deltas and the changed fields """
+        self.hooks['onStateDelta'] += 1
+        for change in changes:
+            self.hooks[f'delta.{change}'] += 1
+
+    @hookimpl
+    def onRequestRunning(self, started, state):
+        """ started jukebox requests """
+        if started:
+            self.hooks['requests'] += 1
+
+
+def percentiles(values):
+    """ p50/p95/max in milliseconds """
+    if not values:
+        return {}
+    ordered = sorted(values)
+    return {
+        'p50': round(ordered[int((len(ordered) - 1) * 0.5)] * 1000, 1),
+        'p95': round(ordered[int((len(ordered) - 1) * 0.95)] * 1000, 1),
+        'max': round(ordered[-1] * 1000, 1),
+    }
+
+
+def inputLatency():
+    """ time from every replayed input until the last span of its trace ended """
+    begins, ends = {}, {}
+    for event in tracer.events:
+        traceId = event['args'].get('traceId')
+        if traceId is None:
+            continue
+        if event['ph'] == 'i':
+            begins[traceId] = event['ts']
+        else:
+            ends[traceId] = max(ends.get(traceId, 0), event['ts'] + event['dur'])
+    return [(ends[traceId] - begin) / 1e6 for traceId, begin in begins.items() if traceId in ends]
+
+
+async def replay(inputHandler, inputs, speed):
+    """ feeds recorded input to the controller like the input devices do """
+    for _ in range(100):  # wait for the first sync
+        if len(inputHandler.state.jukebox.curSongs) > 0:
+            break
+        await asyncio.sleep(0.05)
+    maxQueued = 0
+    started = time.monotonic()
+    for t, action, val in inputs:
+        delay = started + t / speed - time.monotonic()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        tracer.begin('input.replay', action=action)
+        await inputHandler.onInput(action, val)
+        maxQueued = max(maxQueued, len(inputHandler.inputQueue))
+    fed = time.monotonic() - started
+    # wait until all queued input is handled
+    while len(inputHandler.inputQueue) or not inputHandler.requestIdle.is_set():
+        await asyncio.sleep(0.01)
+    await asyncio.sleep(0.1)  # last ui update
+    return fed, time.monotonic() - started, maxQueued
+
+
+def main():
+    """ replay the recording and print the metrics as json """
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("recording", help="Recorded input (json lines, see [logging] inputRecordFile)")
+    parser.add_argument("-c", "--configFile", help="Config file for menus/macros (default: sample config)")
+    parser.add_argument("-s", "--speed", type=float, default=1.0, help="Replay speed factor, eg 10 for bursts")
+    parser.add_argument("-l", "--latency", type=int, default=20, help="Response time of the jukebox server in ms")
+    parser.add_argument("-r", "--repeat", type=int, default=1, help="Replay the recording n times")
+    parser.add_argument("-t", "--trace", help="Write chrome trace event json of the replay")
+    args = parser.parse_args()
+
+    recorded = readRecording(args.recording)
+    duration = recorded[-1][0] if recorded else 0
+    inputs = [(t + run * (duration + 1), action, val) for run in range(args.repeat) for t, action, val in recorded]
+
+    workDir = tempfile.mkdtemp(prefix='rumba-replay-')
+    configFile = args.configFile
+    if configFile is None:
+        configFile = os.path.join(workDir, 'rumba-remote.conf')
+        shutil.copyfile(os.path.join(os.path.dirname(os.path.realpath(__file__)), 'rumba-remote.conf'), configFile)
+    # readConfig clears the cache dir in HOME, keep the one of an installed remote
+    os.environ['HOME'] = workDir
+    try:
+        conf = readConfig(configFile)
+    except ConfigError as ce:
+        sys.exit(ce)
+    conf['controller'].update({
+        'configDir': workDir, 'initAddons': [], 'preloadAddons': False, 'inputRecordFile': None, 'traceFile': None})
+    conf['jukebox'].update({
+        'stateFile': os.path.join(workDir, 'jukebox.state'), 'snapshotInterval': 0, 'historyDir': None})
+
+    loop = asyncio.get_event_loop()
+    jukebox = FakeJukebox(latency=args.latency / 1000)
+    conf['jukebox']['url'] = loop.run_until_complete(jukebox.start())
+
+    pm = pluggy.PluginManager("rumba-remote")
+    pm.add_hookspecs(controller.InputHandler)
+    inputHandler = ReplayHandler(conf, pm)
+    counter = UpdateCounter()
+    pm.register(counter, 'replay')
+    tracer.start(pm)
+    loop.run_until_complete(inputHandler.initTasks())
+    fed, total, maxQueued = loop.run_until_complete(replay(inputHandler, inputs, args.speed))
+    tracer.close()
+    if args.trace:
+        tracer.export(args.trace)
+
+    metrics = inputHandler.getMetrics()
+    print(json.dumps({
+        'inputs': len(inputs),
+        'skipped': dict(inputHandler.skipped),
+        'fed (s)': round(fed, 3),
+        'total (s)': round(total, 3),
+        'throughput (inputs/s)': round(len(inputs) / total, 1) if total else None,
+        'input latency (ms)': percentiles(inputLatency()),
+        'queue': {'max': maxQueued, 'dropped': metrics['inputQueue']['dropped']},
+        'ui': dict(counter.hooks),
+        'jukebox requests': dict(jukebox.requests),
+        'hooks (ms)': metrics['hooks'],
+    }, indent=2))
+
+    # shutdown like rumba-remote.py
+    loop.run_until_complete(inputHandler.server.http.close())
+    loop.call_soon(inputHandler.onClose)
+    loop.run_forever()
+    loop.run_until_complete(asyncio.gather(*asyncio.all_tasks(loop), return_exceptions=True))
+    loop.run_until_complete(jukebox.close())
+    loop.close()
+    shutil.rmtree(workDir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()